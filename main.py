@@ -1,13 +1,18 @@
 # Import packages
-import multiprocessing as mp                    # For multiprocessing
-from multiprocessing import shared_memory
+import os
+import sys
+import copy
+
+# OpenMP and BLAS read their thread counts only when numpy loads them
+from utils.resources import available_cores, set_thread_variables, apply_threads, process_pool
+set_thread_variables(available_cores())
+
 import analysator as pt
 import numpy as np
-from multiprocessing.resource_tracker import unregister
 from configparser import ConfigParser
 import ast
 
-from utils.animation_specs import AnimationSpecs      # Class for animation object
+from utils.animation_specs import AnimationSpecs, outputpath      # Class for animation object
 from utils.animation_2D import Animation2D
 from utils.animation_triple import AnimationTriple
 from utils.animation_fourier import AnimationFourier
@@ -17,6 +22,17 @@ from utils.animation_rms import AnimationRMS
 from utils.animation_reconnection import AnimationReconnection
 from utils.plot_franci import PlotFranci
 from utils.animation_sigma import AnimationSigma
+from utils.animation_s2 import AnimationS2
+from utils.cellid_order import CellIDOrder
+from utils.field_cache import FieldCache
+from utils.precision_check import precision_report
+from utils.derived import derive
+from utils.planner import Plan
+from utils.geometry import publish_geometry, release_geometry, coarsen
+from utils.video import segment_name, concat_segments, concat_npz, frame_ranges, render_frames, output_mode, encode_frames, encode_frame_files, frames_dir, remove_stale_frames
+from utils.manifest import Manifest, code_hash, bulk_identity, settings_identity
+from utils.shared_blocks import allocate_block, block_address, attach_block, release_block
+from utils.summary import join_summaries, share_arrays, release_arrays
 
 config = ConfigParser()
 config.read(".TurbulenceBoxVisualizer.ini")
@@ -32,6 +48,42 @@ end_frame = int(config["settings"]["end_frame"])
 
 animations = list(ast.literal_eval(config["settings"]["animations"]))
 
+# Frames kept in memory at a time in streaming mode, 0 loads the whole range at once
+window_frames = int(config["settings"].get("window_frames", "0"))
+prepass_stride = int(config["settings"].get("prepass_stride", "10"))
+
+# Contiguous frame ranges every animation is rendered in, in parallel, 1 renders serially. 0 writes
+# frame files with one range per core and renders videos serially.
+render_segments = int(config["settings"].get("render_segments", "0"))
+if render_segments == 0:
+    render_segments = available_cores() if output_mode == "frames" else 1
+
+# Skip animations whose manifest fingerprint is unchanged
+skip_unchanged = config["settings"].getboolean("skip_unchanged", fallback=True)
+
+# Preview mode: every preview_stride:th bulkfile on a grid coarsened by preview_coarsen
+preview = config["settings"].getboolean("preview", fallback=False)
+if preview:
+    preview_stride = int(config["settings"].get("preview_stride", "10"))
+    preview_coarsen = int(config["settings"].get("preview_coarsen", "4"))
+else:
+    preview_stride = 1
+    preview_coarsen = 1
+
+# Side of the grid the animations work on
+grid_length = x_length // preview_coarsen
+
+# Storage precision of the shared memory blocks, globally and per vlsv variable
+precision = config["settings"].get("precision", "float64")
+precision_per_variable = dict(ast.literal_eval(config["settings"].get("precision_per_variable", "{}")))
+
+# On-disk cache of fetched fields, disabled when the size cap is 0
+cache_size_gb = float(config.get("cache", "cache_size_gb", fallback="0"))
+if cache_size_gb > 0:
+    field_cache = FieldCache(config.get("cache", "cache_dir", fallback="field_cache/"), int(cache_size_gb * 1024**3))
+else:
+    field_cache = None
+
 # Turn list into list of AnimationSpecs objects
 def cfg_to_AnimationSpecs(animations):
     for i, object in enumerate(animations):
@@ -41,146 +93,419 @@ def cfg_to_AnimationSpecs(animations):
         )
     return animations
 
-# Fetch all cellids of the bulkfiles
-def cellids_fetcher(object):
-    cellids = []
-    for i in range(end_frame - start_frame + 1):
-        vlsvobj = pt.vlsvfile.VlsvReader(object.bulkpath + f"bulk.{str(start_frame + i).zfill(7)}.vlsv")
-        cellids.append(vlsvobj.read_variable("CellID"))
-    return cellids
-
-# Define which variables need to be fetched.
-def variables_to_be(animations):
-    variables_to_be = set() # or not?
-    for object in animations:
-        if object.animation_type == "triple":
-            for component in ["x","y","z"]:
-                variables_to_be.add((object.variable, component))
+# Shape of the shared memory block of a variable-component pair, on a grid of side length
+def block_shape(variable_component, frames, length=None):
+    if length is None:
+        length = grid_length
+    if variable_component[0] == "time":
+        return (frames,)
+    elif variable_component[0] == "vg_ttensor":
+        return (frames, length*length, 3)
+    else:
+        return (frames, length*length)
+
+# Storage precision of the shared memory block of a variable-component pair
+def block_dtype(variable_component):
+    if variable_component[0] == "time":
+        return np.float64
+    return np.dtype(precision_per_variable.get(variable_component[0], precision))
+
+# Apply analysator style operator to a raw variable read from a vlsvfile
+def apply_operator(data, component):
+    if component == "pass":
+        return data
+    elif component == "magnitude":
+        return np.linalg.norm(data, axis=-1)
+    else:
+        return data[:, "xyz".index(component)]
+
+# Sort permutation of CellIDs, cached separately in each fetcher process
+cellid_order = CellIDOrder()
 
-        elif object.animation_type == "rms" and object.component == "pass":
-            for component in ["x","y","z"]:
-                variables_to_be.add((object.variable, component))
+# Gather source in CellID order straight into out
+def take_into(source, order, out):
+    if isinstance(order, slice):
+        out[...] = source
+    else:
+        np.take(source, order, axis=0, out=out)
+
+# Write the sorted and processed frame of a variable-component pair from the raw variable into out, in place
+def extract(raw, order, variable, component, out):
+    if variable == "vg_ttensor":
+        # Only the diagonal is gathered, the full 3x3 tensors are never sorted
+        take_into(np.diagonal(raw, axis1=1, axis2=2), order, out)
+        return
+
+    take_into(apply_operator(raw, component), order, out)
+    # Fluctuating components have their box mean removed
+    if variable != "proton/vg_rho" and component != "magnitude":
+        out -= np.mean(out, dtype=np.float64)
+
+# Read one bulkfile and write every requested variable-component pair into its row.
+# The bulkfile is only opened if some pair is missing from the cache.
+def read_frame(frame, pairs, rows):
+    bulkfile = bulkpath + f"bulk.{str(frame).zfill(7)}.vlsv"
+    if field_cache is not None:
+        identity = field_cache.identity(bulkfile, frame)
+
+    vlsvobj = None
+    raw = {}
+    for variable_component, row in zip(pairs, rows):
+        variable, component = variable_component
+
+        cached = None
+        if field_cache is not None:
+            key = field_cache.key(identity, variable, component, row.dtype)
+            cached = field_cache.load(key)
+
+        if cached is not None:
+            row[...] = cached
+            continue
+
+        if vlsvobj is None:
+            vlsvobj = pt.vlsvfile.VlsvReader(bulkfile)
+            order = cellid_order(vlsvobj.read_variable("CellID"))
+
+        if variable == "time":
+            row[...] = vlsvobj.read_parameter("time")
+        else:
+            if variable not in raw:
+                raw[variable] = vlsvobj.read_variable(variable)
+            extract(raw[variable], order, variable, component, row)
+
+        if field_cache is not None:
+            field_cache.store(key, row)
+
+# read_frame onto the grid of the animations. In preview mode every field is read (or taken from
+# the cache) at full resolution and coarsened into its row.
+def read_grid_frame(frame, pairs, rows):
+    if preview_coarsen == 1:
+        read_frame(frame, pairs, rows)
+        return
+
+    full_rows = [np.empty(block_shape(pair, 1, x_length)[1:], dtype=row.dtype) for pair, row in zip(pairs, rows)]
+    read_frame(frame, pairs, full_rows)
+    for pair, full_row, row in zip(pairs, full_rows, rows):
+        if pair[0] == "time":
+            row[...] = full_row
+        else:
+            mesh = full_row.reshape((x_length, x_length) + full_row.shape[1:])
+            row[...] = coarsen(mesh, preview_coarsen).reshape(row.shape)
 
-        elif object.component == "perp":
-            for component in ["x","y"]:
-                variables_to_be.add((object.variable, component))
+# Open one bulkfile and scatter every needed variable into the shared memory blocks
+def frame_fetcher(task):
+    index, frame, blocks = task
 
-        elif object.animation_type in ["franci", "sigma"]:
-            for component in ["x","y","z"]:
-                variables_to_be.add(("vg_b_vol", component))
-                variables_to_be.add(("proton/vg_v", component))
-            variables_to_be.add(("proton/vg_rho", "pass"))
+    handles = []
+    rows = []
+    for variable_component, block in blocks:
+        shm, data = attach_block(block)
+        handles.append(shm)
+        rows.append(data[index, ...])
 
-            if object.animation_type == "franci":
-                variables_to_be.add(("vg_j", "z"))
-                variables_to_be.add(("vg_ttensor", "pass"))
+    read_grid_frame(frame, [block[0] for block in blocks], rows)
 
-        elif object.animation_type == "reconnection":
-            for component in ["x","y"]:
-                variables_to_be.add(("vg_b_vol", component))
+    del rows
+    for shm in handles:
+        shm.close()
 
-            variables_to_be.add((object.variable, object.component))
+# Fetch data from vlsvfiles frame by frame and place into shared memory
+def fetcher(variables, frame_numbers):
+    shared_blocks_dict = {}
+    blocks = []
+    for variable_component in variables:
+        block = allocate_block(block_shape(variable_component, len(frame_numbers)), block_dtype(variable_component))
+        shared_blocks_dict[variable_component[0] + variable_component[1]] = block
+        blocks.append((variable_component, block_address(block)))
+
+    tasks = [(index, frame, blocks) for index, frame in enumerate(frame_numbers)]
+    with process_pool(len(tasks), "fetch") as process:
+        process.map(frame_fetcher, tasks)
+
+    if field_cache is not None:
+        field_cache.evict()
+
+    return shared_blocks_dict
+
+# Summary of one animation over the frames in shared memory it renders. With keep, the arrays it
+# computed on the way are left in shared memory for the render of those frames.
+def summarizer(task):
+    index, object, keep = task
+    frames = render_frames(object, object.memory_space["timepass"]["shape"][0])
+    summary, computed = animation_classes[object.animation_type].summarize(object, slice(frames.start, frames.stop))
+    return index, summary, share_arrays(computed) if keep else {}
+
+# Pre-pass over every prepass_stride:th frame of the run, window_frames of them at a time, for the
+# summaries the axis and colour limits of every window come from. Only per-frame limits are kept,
+# and with the field cache enabled the later windows are served from the cache.
+def summary_prepass(animations, plan, frame_numbers):
+    frame_numbers = frame_numbers[::prepass_stride]
+    summaries = [[] for object in animations]
+    for first in range(0, len(frame_numbers), window_frames):
+        shared_blocks_dict = fetcher(plan.raw, frame_numbers[first:first + window_frames])
+        derive(plan.derived, shared_blocks_dict, geometry)
+
+        for object in animations:
+            object.memory_space = {key: block_address(block) for key, block in shared_blocks_dict.items()}
+
+        tasks = [(index, object, False) for index, object in enumerate(animations)]
+        with process_pool(len(tasks), "prepass") as process:
+            for index, summary, computed in process.map(summarizer, tasks):
+                summaries[index].append(summary)
+
+        for block in shared_blocks_dict.values():
+            release_block(block)
+
+    return [join_summaries(parts) for parts in summaries]
+
+# Fetch, derive and animate one frame range. Every shared memory block is released as soon as
+# the last derived field or animation reading it has finished.
+def run_frames(animations, plan, frame_numbers):
+    # Fetch all needed data into separate shared memory blocks, opening each bulkfile once
+    shared_blocks_dict = fetcher(plan.raw, frame_numbers)
+    consumers_left = plan.consumers_left()
+
+    def finished(consumer):
+        for key in plan.finished(consumer, consumers_left):
+            release_block(shared_blocks_dict.pop(key))
+
+    derive(plan.derived, shared_blocks_dict, geometry, finished)
 
+    # Include memory space addresses to animation objects
+    for animation in animations:
+        animation.memory_space = {key: block_address(block) for key, block in shared_blocks_dict.items()}
+
+    # Frame files left by runs with other inputs, settings or code are never mixed with new ones
+    if output_mode == "frames":
+        for animation in animations:
+            remove_stale_frames(animation.name, animation.fingerprint)
+
+    # Launch a process for each frame range of each AnimationSpecs object, at most one per core
+    tasks = render_tasks(animations, len(frame_numbers))
+    summarize_ranges(animations, tasks)
+    ranges_left = [0] * len(animations)
+    for index, object in tasks:
+        ranges_left[index] += 1
+
+    rendered = []
+    with process_pool(len(tasks), "animations") as process:
+        for index, files in process.imap_unordered(chooser, tasks):
+            rendered += files
+            ranges_left[index] -= 1
+            if ranges_left[index] == 0:
+                finished(("animation", index))
+
+    for index, object in tasks:
+        release_arrays(object.computed)
+
+    join_segments(rendered)
+
+    # Delete whatever shared memory is left
+    for block in shared_blocks_dict.values():
+        release_block(block)
+
+# One task per animation, or with render_segments > 1 one per contiguous frame range of every
+# animation. rms and franci draw their curves over the whole run and are never split.
+def render_tasks(animations, frames):
+    tasks = []
+    for index, object in enumerate(animations):
+        if render_segments <= 1 or object.animation_type in ["rms", "franci"]:
+            tasks.append((index, object))
+            continue
+
+        ranges = frame_ranges(frames, render_segments)
+        for segment, (first, last) in enumerate(ranges):
+            part = copy.copy(object)
+            # The last range runs to the end of whatever the animation renders
+            part.render_range = (first, None if segment == len(ranges) - 1 else last)
+            part.render_segment = segment
+            part.rendered = []
+            tasks.append((index, part))
+    return tasks
+
+# Animations split into frame ranges take their limits from the summaries of all of their ranges,
+# computed in one pass before any range is drawn, so that every range only works on its own
+# frames. The arrays computed for the summaries stay in shared memory for the ranges to draw.
+# In streaming mode the pre-pass has summarized the whole run already.
+def summarize_ranges(animations, tasks):
+    split = [(index, object) for index, object in tasks if object.render_range is not None and not animations[index].summary]
+    if len(split) == 0:
+        return
+
+    summaries = {}
+    with process_pool(len(split), "summaries") as process:
+        results = process.map(summarizer, [(index, object, True) for index, object in split])
+    for (index, object), (_, summary, computed) in zip(split, results):
+        summaries.setdefault(index, []).append(summary)
+        object.computed = computed
+
+    for index, parts in summaries.items():
+        animations[index].summary = join_summaries(parts)
+    for index, object in tasks:
+        object.summary = animations[index].summary
+
+# Join the segments of parallel renders and their data files into their outputs, in frame order
+def join_segments(rendered):
+    segments = {}
+    for output, name in rendered:
+        if output != name:
+            segments.setdefault(name, []).append(output)
+
+    for name, outputs in segments.items():
+        if name.endswith(".npz"):
+            concat_npz(sorted(outputs), name)
         else:
-            variables_to_be.add((object.variable, object.component))
-        
-        if object.animation_type == "2D" and object.unitless == True and object.component != "pass":
-            variables_to_be.add((object.variable, "magnitude"))
+            concat_segments(sorted(outputs), name, encode=True)
 
-        if object.animation_type == "triple" and object.unitless == True:
-            variables_to_be.add((object.variable, "magnitude"))
-
-        variables_to_be.add(("time", "pass"))
+# Encode the frame files of every animation into its output when asked to, once all of its
+# frames are on disk
+def encode_outputs(animations):
+    if output_mode != "frames" or not encode_frames:
+        return
+    for object in animations:
+        directory = frames_dir(object.name, object.fingerprint)
+        if os.path.isdir(directory):
+            encode_frame_files(directory, object.name)
 
-    return variables_to_be
+# Run the animations window by window so that only window_frames frames are in shared memory
+# at a time. Every window produces a segment per animation and the segments are joined at the end.
+def streamer(animations, plan, frame_numbers):
+    for object in animations:
+        if object.animation_type in ["rms", "franci"]:
+            print(f"{object.animation_type} needs the whole frame range at once, set window_frames = 0")
+            sys.exit(1)
 
-# Fetch data from vlsvfiles and place into shared memory
-def fetcher(variable_component):
-    if variable_component[0] == "proton/vg_rho" or variable_component[1] == "magnitude":
-        data = np.empty((end_frame - start_frame + 1, x_length*x_length))
-        for frame in range(end_frame - start_frame + 1):
-            vlsvobj = pt.vlsvfile.VlsvReader(bulkpath + f"bulk.{str(start_frame + frame).zfill(7)}.vlsv")
-            data[frame] = np.array(vlsvobj.read_variable(variable_component[0], operator = variable_component[1]))[cellids[frame].argsort()]
+    for object, summary in zip(animations, summary_prepass(animations, plan, frame_numbers)):
+        object.summary = summary
 
-    elif variable_component[0] == "vg_ttensor":
-        data = np.empty((end_frame - start_frame + 1, x_length*x_length,3))
-        for frame in range(end_frame - start_frame + 1):
-            vlsvobj = pt.vlsvfile.VlsvReader(bulkpath + f"bulk.{str(start_frame + frame).zfill(7)}.vlsv")
-            data[frame] = np.diagonal(vlsvobj.read_variable(variable_component[0], operator = variable_component[1])[cellids[frame].argsort()], axis1=1, axis2=2)
+    # Every window writes the segments of its window number, frame files are numbered over the whole run
+    windows = range(0, len(frame_numbers), window_frames)
+    for window, first in enumerate(windows):
+        for object in animations:
+            object.window = window
+            object.frame_offset = first
 
-    elif variable_component[0] == "time":
-        data = np.empty(end_frame - start_frame + 1)
-        for frame in range(end_frame - start_frame + 1):
-            vlsvobj = pt.vlsvfile.VlsvReader(bulkpath + f"bulk.{str(start_frame + frame).zfill(7)}.vlsv")
-            data[frame] = vlsvobj.read_parameter("time")
+        run_frames(animations, plan, frame_numbers[first:first + window_frames])
 
-    else:
-        data = np.empty((end_frame - start_frame + 1, x_length*x_length))
-        for frame in range(end_frame - start_frame + 1):
-            vlsvobj = pt.vlsvfile.VlsvReader(bulkpath + f"bulk.{str(start_frame + frame).zfill(7)}.vlsv")
-            frame_data = np.array(vlsvobj.read_variable(variable_component[0], operator = variable_component[1]))[cellids[frame].argsort()]
-            data[frame] = frame_data - np.mean(frame_data)
-
-    shm = shared_memory.SharedMemory(create=True, size=data.nbytes)
-    shm_array = np.ndarray(data.shape, dtype=data.dtype, buffer=shm.buf)
-    shm_array[:] = data[:]  # Copy data into shared memory
-    block = {
-        "address": shm.name,
-        "shape": data.shape,
-        "dtype": data.dtype,
-        "shm": shm,
-    }
-    unregister(shm._name, 'shared_memory')
-    return (variable_component[0] + variable_component[1], block)
-
-# Function for launching correct animation for each animation object
-def chooser(object):
-    
-    if object.animation_type == "2D":
-        Animation2D(object)
-    elif object.animation_type == "triple":
-        AnimationTriple(object)
-    elif object.animation_type == "fourier":
-        AnimationFourier(object)
-    elif object.animation_type == "sf":
-        AnimationSF(object)
-    elif object.animation_type == "kurtosis":
-        AnimationKurtosis(object)
-    elif object.animation_type == "rms":
-        AnimationRMS(object)
-    elif object.animation_type == "reconnection":
-        AnimationReconnection(object)
-    elif object.animation_type == "franci":
-        PlotFranci(object)
-    elif object.animation_type == "sigma":
-        AnimationSigma(object)
+    for object in animations:
+        object.window = None
+        object.frame_offset = 0
+        concat_segments([segment_name(object.name, window) for window in range(len(windows))], object.name)
+        # Data files written next to the segments, such as the kurtosis .npz
+        data_name = os.path.splitext(object.name)[0] + ".npz"
+        concat_npz([segment_name(data_name, window) for window in range(len(windows))], data_name)
+
+# Report how far PSDs and kurtosis curves of float32 variables drift from the float64 path, using the first frame
+def precision_checker(animations, variables):
+    delta_ls = [2, 4, 8, 16, 32, 64]
+    for object in animations:
+        if object.animation_type == "kurtosis":
+            delta_ls = object.delta_ls
+
+    vlsvobj = pt.vlsvfile.VlsvReader(bulkpath + f"bulk.{str(start_frame).zfill(7)}.vlsv")
+    order = cellid_order(vlsvobj.read_variable("CellID"))
+
+    single = sorted({variable for variable, component in variables
+                     if block_dtype((variable, component)) == np.float32 and variable not in ["time", "vg_ttensor"]})
+    for variable in single:
+        raw = vlsvobj.read_variable(variable)
+        if raw.ndim == 1:
+            components = ["pass"]
+        else:
+            components = ["x", "y", "z"]
+
+        meshes = {}
+        for component in components:
+            meshes[component] = np.empty((x_length, x_length))
+            extract(raw, order, variable, component, meshes[component].reshape(-1))
+
+        report = precision_report(meshes, delta_ls)
+        print(f"float32 check {variable}: " + ", ".join(f"{name} {value:.2e}" for name, value in report.items()))
+
+# File or directory an animation leaves behind once it has finished
+def expected_output(object):
+    if output_mode == "frames" and not encode_frames:
+        return frames_dir(object.name, object.fingerprint)
+    return object.name
+
+# Drop the animations whose manifest fingerprint is unchanged and whose output exists, before
+# anything is fetched for them. Returns the remaining animations and their fingerprints.
+def unchanged_filter(animations, manifest, frame_numbers):
+    bulk = bulk_identity(bulkpath, frame_numbers)
+    settings = settings_identity(config)
+    code = code_hash()
+
+    pending = []
+    fingerprints = []
+    for object in animations:
+        fingerprint = manifest.fingerprint(object, bulk, (frame_numbers[0], frame_numbers[-1]), settings, code)
+        object.fingerprint = fingerprint
+        if skip_unchanged and manifest.unchanged(object, fingerprint, expected_output(object)):
+            print(f"unchanged, skipped: {object.name}")
+            continue
+        pending.append(object)
+        fingerprints.append(fingerprint)
+    return pending, fingerprints
+
+# Animation class of every animation type
+animation_classes = {
+    "2D": Animation2D,
+    "triple": AnimationTriple,
+    "fourier": AnimationFourier,
+    "sf": AnimationSF,
+    "kurtosis": AnimationKurtosis,
+    "rms": AnimationRMS,
+    "reconnection": AnimationReconnection,
+    "franci": PlotFranci,
+    "sigma": AnimationSigma,
+    "s2": AnimationS2,
+}
+
+# Function for launching correct animation for each animation object, returns the files it wrote
+def chooser(task):
+    index, object = task
+    animation_classes[object.animation_type](object)
+    return index, object.rendered
 
 if __name__ == "__main__":
     animations = cfg_to_AnimationSpecs(animations)
 
-    global cellids
-    cellids = cellids_fetcher(animations[0])
+    # The main process derives fields between the pools and may use every core for it
+    print(f"resources: {available_cores()} cores")
+    apply_threads(available_cores())
 
-    variables = variables_to_be(animations)
+    # Mesh geometry is read once here and shared with every animation process
+    geometry = publish_geometry(vlsvobj, preview_coarsen)
+    for object in animations:
+        object.geometry = geometry
 
-    # Fetch all needed data into separate shared memory blocks
-    shared_blocks = []
-    with mp.Pool(len(variables)) as process:
-        shared_blocks = process.map(fetcher, variables)
+    frame_numbers = list(range(start_frame, end_frame + 1, preview_stride))
 
-    shared_blocks_dict = {}
-    for i in range(len(shared_blocks)):
-        shared_blocks_dict[shared_blocks[i][0]] = shared_blocks[i][1]
+    if preview:
+        print(f"preview: {len(frame_numbers)} frames on a {grid_length}x{grid_length} grid, written to {outputpath}")
+        os.makedirs(outputpath, exist_ok=True)
 
-    # Include memory space addresses to animation objects
-    for animation in animations:
-        animation.memory_space = shared_blocks_dict
+    # Animations produced earlier from the same inputs are left out of the plan
+    manifest = Manifest(outputpath)
+    animations, fingerprints = unchanged_filter(animations, manifest, frame_numbers)
+
+    if len(animations) > 0:
+        # Minimal set of reads and derivations covering every animation
+        plan = Plan(animations, animation_classes)
+        print(plan.describe())
+
+        if config["settings"].getboolean("precision_check", fallback=False):
+            precision_checker(animations, plan.raw)
+
+        if window_frames > 0:
+            streamer(animations, plan, frame_numbers)
+        else:
+            # The whole frame range in shared memory at once
+            run_frames(animations, plan, frame_numbers)
+        encode_outputs(animations)
 
-    # Launch a separate process for each AnimationSpecs object
-    with mp.Pool(len(animations)) as process:
-        process.map(chooser, animations)
+        for object, fingerprint in zip(animations, fingerprints):
+            manifest.record(object, fingerprint)
+        manifest.save()
 
-    # Delete shared memory
-    for block in shared_blocks:
-        block[1]['shm'].close()
-        block[1]['shm'].unlink()
\ No newline at end of file
+    release_geometry(geometry)
@@ -1,11 +1,13 @@
 import os
 from configparser import ConfigParser
-import analysator as pt
 import numpy as np
 import matplotlib.pyplot as plt
 from multiprocessing import shared_memory
-from matplotlib import animation
-from matplotlib.animation import FFMpegWriter
+from utils.geometry import Geometry
+from utils.video import save_animation
+from utils.heatmap import Heatmap
+from utils.shared_blocks import attach_block
+from utils.summary import frame_limits, run_limits
 
 config = ConfigParser()
 config.read(".TurbulenceBoxVisualizer.ini")
@@ -18,6 +20,28 @@ os.environ['PATH']= config["paths"]["latex_path"] + os.environ['PATH']
 os.environ['PTNOLATEX']='1'
 
 class Animation2D():
+    @staticmethod
+    def inputs(object):
+        inputs = [(object.variable, object.component)]
+        if object.unitless == True:
+            inputs.append((object.variable, "magnitude"))
+        return inputs
+
+    # Limits of the plotted field in the frames (a slice of the shared blocks) for renders in parts
+    @staticmethod
+    def summarize(object, frames):
+        shm, data = attach_block(object.memory_space[object.variable + object.component])
+        if object.unitless == True:
+            shm_norm, mag = attach_block(object.memory_space[object.variable + "magnitude"])
+            summary = {"data": frame_limits(data[frames]) / np.average(mag[frames], axis = 1)[:, None]}
+            del mag
+            shm_norm.close()
+        else:
+            summary = {"data": frame_limits(data[frames]) / object.unit}
+        del data
+        shm.close()
+        return summary, {}
+
     def __init__(self, object):
         self.object = object
         self.memory_space = object.memory_space
@@ -25,19 +49,10 @@ class Animation2D():
         shm_time = shared_memory.SharedMemory(name=self.memory_space["timepass"]["address"])
         self.time = np.ndarray(self.memory_space["timepass"]["shape"], dtype=self.memory_space["timepass"]["dtype"], buffer=shm_time.buf)
 
-        self.vlsvobj = pt.vlsvfile.VlsvReader(object.bulkpath + "bulk.0000000.vlsv")
-        self.cellids = self.vlsvobj.read_variable("CellID")
-
-        prot_plas_freq = np.sqrt(1e6 * (1.602176634 * 10**(-19))**2 / (8.8541878128 * 10**(-12) * 1.67262192595 * 10**(-27)))
-        dp = 299792458 / prot_plas_freq
-
-        self.x_length = int(self.vlsvobj.read_parameter("xcells_ini"))
-        coords = np.array(self.vlsvobj.get_cell_coordinates(np.sort(self.cellids))).T
-        x = coords[0]
-        y = coords[1]
-
-        self.x_mesh = x.reshape(-1,self.x_length) / dp
-        self.y_mesh = y.reshape(-1,self.x_length) / dp
+        self.geometry = Geometry(object.geometry)
+        self.x_length = self.geometry.x_length
+        self.x_mesh = self.geometry.x_mesh / self.geometry.dp
+        self.y_mesh = self.geometry.y_mesh / self.geometry.dp
 
         self.frames = len(self.time)
 
@@ -53,26 +68,24 @@ class Animation2D():
 
         mem_norm = self.memory_space[self.object.variable+"magnitude"]
         shm_norm = shared_memory.SharedMemory(name=mem_norm["address"])
-        mag = np.ndarray(mem_norm["shape"], dtype=mem_norm["dtype"], buffer=shm_norm.buf)
-        mag_average = np.average(mag, axis = 1)
-
-        unitless_data = data / mag_average[:, None]
+        self.mag = np.ndarray(mem_norm["shape"], dtype=mem_norm["dtype"], buffer=shm_norm.buf)
 
         fig, self.ax = plt.subplots()
 
-        self.Min = round(min(unitless_data.flatten()), 15)
-        self.Max = round(max(unitless_data.flatten()), 15)
+        # Rendered in parts, the colour limits cover the whole run
+        summary = self.object.summary or self.summarize(self.object, slice(0, self.frames))[0]
+        self.Min, self.Max = [round(limit, 15) for limit in run_limits(summary)["data"]]
 
         if abs(self.Min) > abs(self.Max):
             self.Max = -self.Min
         else:
             self.Min = -self.Max
 
-        self.data_mesh = unitless_data.reshape((self.frames, self.x_length, self.x_length))
+        # Normalized a frame at a time, only the frames of the render range are read
+        self.data_mesh = data.reshape((self.frames, self.x_length, self.x_length))
 
-        self.p = [
-            self.ax.pcolormesh(self.x_mesh, self.y_mesh, self.data_mesh[0], cmap = "bwr", vmin=self.Min, vmax=self.Max)]
-        cbar = fig.colorbar(self.p[0])
+        self.heatmap = Heatmap(self.ax, self.x_mesh, self.y_mesh, self.unitless_frame(0), cmap = "bwr", vmin=self.Min, vmax=self.Max)
+        cbar = fig.colorbar(self.heatmap.image)
 
         title = f"$\\frac{{{"\\delta " + self.object.variable_name + "_" + self.object.component}}}{{\\langle {self.object.variable_name}\\rangle}}$"
         self.ax.set_title(r'{}'.format(title), fontsize=16)
@@ -81,18 +94,15 @@ class Animation2D():
         self.timelabel = self.ax.text(0.98, 1.02, "",transform=self.ax.transAxes)
         
 
-        anim = animation.FuncAnimation(fig, self.unitless_update, frames = self.frames, interval = 20)
-
-        writer = FFMpegWriter(fps=5)
-        anim.save(self.object.name, writer = writer)
+        save_animation(fig, self.unitless_update, self.frames, self.object.name, self.object, heatmaps=[self.heatmap])
         plt.close()
 
+    def unitless_frame(self, frame):
+        return self.data_mesh[frame] / np.average(self.mag[frame])
+
     def unitless_update(self,frame):
-        self.p[0].remove()
         self.timelabel.set_text(f"{self.time[frame]:.1f}s")
-        self.p = [
-            self.ax.pcolormesh(self.x_mesh, self.y_mesh, self.data_mesh[frame], cmap = "bwr", vmin=self.Min, vmax=self.Max)]
-        return self.p[0]
+        return [self.heatmap.set_data(self.unitless_frame(frame)), self.timelabel]
 
     def animation_unit(self):
         mem_data = self.memory_space[self.object.variable+self.object.component]
@@ -101,8 +111,9 @@ class Animation2D():
 
         fig, self.ax = plt.subplots()
 
-        self.Min = round(min(data.flatten())/self.object.unit, 10)
-        self.Max = round(max(data.flatten())/self.object.unit, 10)
+        # Rendered in parts, the colour limits cover the whole run
+        summary = self.object.summary or self.summarize(self.object, slice(0, self.frames))[0]
+        self.Min, self.Max = [round(limit, 10) for limit in run_limits(summary)["data"]]
 
         if abs(self.Min) > abs(self.Max):
             self.Max = -self.Min
@@ -111,9 +122,8 @@ class Animation2D():
 
         self.data_mesh = data.reshape((self.frames, self.x_length, self.x_length))
 
-        self.p = [
-            self.ax.pcolormesh(self.x_mesh, self.y_mesh, self.data_mesh[0]/self.object.unit, cmap = "bwr", vmin=self.Min, vmax=self.Max)]
-        cbar = fig.colorbar(self.p[0])
+        self.heatmap = Heatmap(self.ax, self.x_mesh, self.y_mesh, self.data_mesh[0]/self.object.unit, cmap = "bwr", vmin=self.Min, vmax=self.Max)
+        cbar = fig.colorbar(self.heatmap.image)
         
         if self.object.component != "pass":
             self.ax.set_title(r'$\delta {}$'.format(self.object.variable_name + "_" + self.object.component), fontsize=16)
@@ -124,17 +134,11 @@ class Animation2D():
         self.ax.set_ylabel(r'$y/d_p$', rotation=0, fontsize=12)
         self.timelabel = self.ax.text(0.98, 1.02, "",transform=self.ax.transAxes)
 
-        anim = animation.FuncAnimation(fig, self.unit_update, frames = self.frames, interval = 20)
-
-        writer = FFMpegWriter(fps=5)
-        anim.save(self.object.name, writer = writer)
+        save_animation(fig, self.unit_update, self.frames, self.object.name, self.object, heatmaps=[self.heatmap])
         plt.close()
 
     def unit_update(self,frame):
-        self.p[0].remove()
         self.timelabel.set_text(f"{self.time[frame]:.1f}s")
-        self.p = [
-            self.ax.pcolormesh(self.x_mesh, self.y_mesh, self.data_mesh[frame]/self.object.unit, cmap = "bwr", vmin=self.Min, vmax=self.Max)]
-        return self.p[0]
+        return [self.heatmap.set_data(self.data_mesh[frame]/self.object.unit), self.timelabel]
 
     
\ No newline at end of file
@@ -1,14 +1,17 @@
 import os
 from configparser import ConfigParser
-import analysator as pt
 import numpy as np
 import matplotlib.pyplot as plt
 import scipy as sp
 from multiprocessing import shared_memory
 from matplotlib.colors import LogNorm
-from matplotlib import animation
-from matplotlib.animation import FFMpegWriter
 from matplotlib.widgets import SpanSelector
+from utils.geometry import Geometry
+from utils.video import save_animation, render_frames
+from utils.heatmap import Heatmap
+from utils.spectra import half_plane_k, hermitian_weights, full_plane, RadialBinner, local_slopes
+from utils.shared_blocks import attach_block
+from utils.summary import frame_limits, run_limits, range_results
 
 config = ConfigParser()
 config.read(".TurbulenceBoxVisualizer.ini")
@@ -21,6 +24,77 @@ os.environ['PATH']= config["paths"]["latex_path"] + os.environ['PATH']
 os.environ['PTNOLATEX']='1'
 
 class AnimationFourier():
+    @staticmethod
+    def inputs(object):
+        return [("derived/PSD_perp/" + object.variable, "pass")]
+
+    # Limits of the plotted spectra in the frames (a slice of the shared blocks) and the 1D spectra
+    # of the 1D and window modes, the 2D mode draws the shared half plane spectra directly
+    @staticmethod
+    def summarize(object, frames):
+        geometry = Geometry(object.geometry)
+        shm, PSD_2D_perp = attach_block(object.memory_space["derived/PSD_perp/" + object.variable + "pass"])
+        if object.fourier_type == "2D":
+            summary, computed = {"PSD": frame_limits(PSD_2D_perp[frames])}, {}
+        else:
+            if object.fourier_type == "1D":
+                k_vals, PSD_1D_perp = AnimationFourier.PSD_1D(geometry, PSD_2D_perp[frames])
+            else:
+                k_vals, PSD_1D_perp = AnimationFourier.PSD_window(geometry, PSD_2D_perp[frames])
+            summary, computed = {"PSD": frame_limits(PSD_1D_perp)}, {"k_vals": k_vals, "PSD": PSD_1D_perp}
+        del PSD_2D_perp
+        shm.close()
+        return summary, computed
+
+    # Wavenumbers in units of 1/d_p and the 1D spectrum of every frame of the half plane spectra,
+    # on linear bins. Every half plane mode counts together with its mirror image, empty bins are left out
+    @staticmethod
+    def PSD_1D(geometry, PSD_2D_perp):
+        KX, KY = half_plane_k(geometry.x_length, geometry.dx)
+        K_perp = np.sqrt(KX**2 + KY**2).flatten()
+        weights = np.broadcast_to(hermitian_weights(geometry.x_length), KX.shape).flatten()
+
+        del KX, KY
+
+        k_min = min(K_perp)
+        k_max = max(K_perp)
+        kbins = np.arange(k_min, k_max, k_max/512)
+
+        binner = RadialBinner(K_perp, kbins, weights)
+        PSD_1D_perp = binner.reduce(PSD_2D_perp, statistic="mean")[:, ~binner.empty]
+        PSD_1D_perp *= np.pi * (kbins[1:]**2 - kbins[:-1]**2)[~binner.empty]
+
+        return binner.centres[~binner.empty] * geometry.dp, PSD_1D_perp
+
+    # Wavenumbers in units of 1/d_p and the 1D spectrum of every frame of the half plane spectra,
+    # summed over 31 logarithmic bins from the smallest non-zero to the largest wavenumber of the grid
+    @staticmethod
+    def PSD_window(geometry, PSD_2D_perp):
+        KX, KY = half_plane_k(geometry.x_length, geometry.dx)
+        K_perp = np.sqrt(KX**2 + KY**2).flatten()
+        weights = np.broadcast_to(hermitian_weights(geometry.x_length), KX.shape).flatten()
+
+        del KX, KY
+
+        # Smallest non-zero and largest wavenumber of the grid
+        k_min = np.min(K_perp[K_perp > 0])
+        k_max = np.max(K_perp)
+
+        #kbins = np.concatenate([np.array([0]), np.logspace(np.log10(k_min*0.1), np.log10(k_max), num=31)])
+        binner = RadialBinner.log(K_perp, k_min, k_max, 31, weights)
+        kbins = binner.edges
+
+        #kbins = np.arange(k_min, k_max, 16*k_max/self.x_length)
+
+        # Bins with no modes are left out
+        non_zeros = ~binner.empty
+        PSD_1D_perp = binner.reduce(PSD_2D_perp, statistic="sum")[:, non_zeros]
+
+        prot_plas_freq = np.sqrt(5e6 * (1.602176634 * 10**(-19))**2 / (8.8541878128 * 10**(-12) * 1.67262192595 * 10**(-27)))
+        dp = 299792458 / prot_plas_freq
+        k_vals = 0.5 * (kbins[1:] + kbins[:-1]) * dp
+        return k_vals[non_zeros], PSD_1D_perp
+
     def __init__(self, object):
         self.object = object
         self.memory_space = object.memory_space
@@ -29,11 +103,8 @@ class AnimationFourier():
         self.time = np.ndarray(self.memory_space["timepass"]["shape"], dtype=self.memory_space["timepass"]["dtype"], buffer=shm_time.buf)
         self.frames = len(self.time)
         
-        self.vlsvobj = pt.vlsvfile.VlsvReader(object.bulkpath + "bulk.0000000.vlsv")
-        self.cellids = self.vlsvobj.read_variable("CellID")
-
-        self.x_length = int(self.vlsvobj.read_parameter("xcells_ini"))
-        self.x = np.array(self.vlsvobj.get_cell_coordinates(np.sort(self.cellids))).T[0]
+        self.geometry = Geometry(object.geometry)
+        self.x_length = self.geometry.x_length
         
         if object.fourier_type == "1D":
             self.animation_1D_PSD()
@@ -42,68 +113,30 @@ class AnimationFourier():
         elif object.fourier_type == "window":
             self.window()
 
+    # Perpendicular power spectrum of the variable on the rfft2 half plane, computed once per run
+    # and shared by every fourier animation of the variable
+    def attach_PSD(self):
+        mem_PSD = self.memory_space["derived/PSD_perp/" + self.object.variable + "pass"]
+        self.shm_PSD = shared_memory.SharedMemory(name=mem_PSD["address"])
+        return np.ndarray(mem_PSD["shape"], dtype=mem_PSD["dtype"], buffer=self.shm_PSD.buf)
+
     def animation_1D_PSD(self):
         fig, self.ax = plt.subplots()
 
-        mem_x = self.memory_space[self.object.variable + "x"]
-        mem_y = self.memory_space[self.object.variable + "y"]
-
-        shm_x = shared_memory.SharedMemory(name=mem_x["address"])
-        shm_y = shared_memory.SharedMemory(name=mem_y["address"])
-        
-        data_x = np.ndarray(mem_x["shape"], dtype=mem_x["dtype"], buffer=shm_x.buf)
-        data_y = np.ndarray(mem_y["shape"], dtype=mem_y["dtype"], buffer=shm_y.buf)
-
-        # Reshape raw data into mesh
-        data_x_mesh = data_x.reshape((self.frames, self.x_length, self.x_length))
-        data_y_mesh = data_y.reshape((self.frames, self.x_length, self.x_length))
-
-        # Fourier transfrom meshshes
-        data_x_mesh_ft = np.abs(sp.fft.fft2(data_x_mesh, workers = 8, axes=(-2, -1)))
-        data_y_mesh_ft = np.abs(sp.fft.fft2(data_y_mesh, workers = 8, axes=(-2, -1)))
-
-        # |F_perp|**2 = |F_x|**2 + |F_y|**2
-        PSD_2D_perp = data_x_mesh_ft**2 + data_y_mesh_ft**2
-
-        del data_x_mesh_ft, data_y_mesh_ft
-        
-        nbins = 500
-        dx = np.diff(self.x[0:self.x_length])[0]
-
-        k_xy = 2 * np.pi * sp.fft.fftfreq(self.x_length, dx)
-        KX, KY = np.meshgrid(k_xy, k_xy)
-        K_perp = np.sqrt(KX**2 + KY**2)
-        K_perp = K_perp.flatten()
-
-        del k_xy, KX, KY
-
-        k_min = min(K_perp)
-        k_max = max(K_perp)
-        kbins = np.arange(k_min, k_max, k_max/512)
-        print(len(kbins))
-
-        self.PSD_1D_perp = np.empty((self.frames, len(kbins)-1))
-        
-        #for frame in range(self.frames):
-        #    self.PSD_1D_perp[frame] = np.bincount(bin_idx, weights = PSD_2D_perp[frame].ravel(), minlength=nbins)
-
-        for frame in range(self.frames):
-            value = PSD_2D_perp[frame].flatten()
-            self.PSD_1D_perp[frame],_,_ = sp.stats.binned_statistic(K_perp, value, statistic="mean",bins=kbins)
-            self.PSD_1D_perp[frame] *= np.pi * (kbins[1:]**2 - kbins[:-1]**2)
-
-        del PSD_2D_perp
+        # Only the frames of the render range
+        frames = render_frames(self.object, self.frames)
+        self.first = frames.start
+        summary, computed = range_results(AnimationFourier, self.object, frames)
+        self.k_vals, self.PSD_1D_perp = computed["k_vals"], computed["PSD"]
 
         print(self.PSD_1D_perp)
 
-        Min = min(self.PSD_1D_perp.flatten())
-        Max = max(self.PSD_1D_perp.flatten())
+        # Rendered in parts, the axis limits cover the whole run
+        Min, Max = run_limits(self.object.summary or summary)["PSD"]
 
         self.p = [self.ax.plot([], [])]
 
-        prot_plas_freq = np.sqrt(1e6 * (1.602176634 * 10**(-19))**2 / (8.8541878128 * 10**(-12) * 1.67262192595 * 10**(-27)))
-        self.dp = 299792458 / prot_plas_freq
-        self.k_vals = 0.5 * (kbins[1:] + kbins[:-1]) * self.dp
+        self.dp = self.geometry.dp
         """ a = Max * (10**(-6) * self.dp)**2
         b = Max * (10**(-6) * self.dp)**(5/3)
         c = Max * (10**(-6) * self.dp)**3
@@ -126,53 +159,30 @@ class AnimationFourier():
 
         self.timelabel = self.ax.text(0.98, 1.02, "", transform=self.ax.transAxes)
 
-        anim = animation.FuncAnimation(fig, self.update_1D_PSD, frames = self.frames, interval = 20)
-        
-        writer = FFMpegWriter(fps=5)
-        anim.save(self.object.name, writer = writer)
+        save_animation(fig, self.update_1D_PSD, self.frames, self.object.name, self.object)
         plt.close()
 
     def update_1D_PSD(self, frame):
-        self.p[0][0].set_data(self.k_vals, self.PSD_1D_perp[frame])
+        self.p[0][0].set_data(self.k_vals, self.PSD_1D_perp[frame - self.first])
         self.timelabel.set_text(f"{self.time[frame]:.1f}s")
         return self.p
 
     def animation_2D_PSD(self):
         fig, self.ax = plt.subplots()
 
-        mem_x = self.memory_space[self.object.variable + "x"]
-        mem_y = self.memory_space[self.object.variable + "y"]
-
-        shm_x = shared_memory.SharedMemory(name=mem_x["address"])
-        shm_y = shared_memory.SharedMemory(name=mem_y["address"])
-        
-        data_x = np.ndarray(mem_x["shape"], dtype=mem_x["dtype"], buffer=shm_x.buf)
-        data_y = np.ndarray(mem_y["shape"], dtype=mem_y["dtype"], buffer=shm_y.buf)
-
-        # Reshape raw data into mesh
-        data_x_mesh = data_x.reshape((self.frames, self.x_length, self.x_length))
-        data_y_mesh = data_y.reshape((self.frames, self.x_length, self.x_length))
-
-        # Fourier transfrom meshshes
-        data_x_mesh_ft = np.abs(sp.fft.fftshift(sp.fft.fft2(data_x_mesh, workers = 8, axes=(-2, -1)), axes = (-2,-1)))
-        data_y_mesh_ft = np.abs(sp.fft.fftshift(sp.fft.fft2(data_y_mesh, workers = 8, axes=(-2, -1)), axes = (-2,-1)))
-
-        # |F_perp|**2 = |F_x|**2 + |F_y|**2
-        self.PSD_2D_perp = data_x_mesh_ft**2 + data_y_mesh_ft**2
-
-        del data_x_mesh_ft, data_y_mesh_ft
+        self.PSD_2D_perp = self.attach_PSD()
 
-        self.Min = np.min(self.PSD_2D_perp.ravel())
-        self.Max = np.max(self.PSD_2D_perp.ravel())
+        # Rendered in parts, the colour limits cover the whole run
+        summary = self.object.summary or self.summarize(self.object, slice(0, self.frames))[0]
+        self.Min, self.Max = run_limits(summary)["PSD"]
 
-        dx = np.diff(self.x[0:self.x_length])[0]
+        dx = self.geometry.dx
 
         k_xy = 2 * np.pi * sp.fft.fftshift(sp.fft.fftfreq(self.x_length, dx))
-        self.KX, self.KY = np.meshgrid(k_xy, k_xy)
 
-        self.p = [self.ax.pcolormesh(self.KX, self.KY, self.PSD_2D_perp[0], norm=LogNorm(vmin=1e-9, vmax=self.Max))]
+        self.heatmap = Heatmap(self.ax, k_xy, k_xy, self.PSD_2D_frame(0), norm=LogNorm(vmin=1e-9, vmax=self.Max))
 
-        cbar = fig.colorbar(self.p[0])
+        cbar = fig.colorbar(self.heatmap.image)
         self.ax.set_xlim(-10e-6, 10e-6)
         self.ax.set_ylim(-10e-6, 10e-6)
 
@@ -183,111 +193,37 @@ class AnimationFourier():
 
         self.timelabel = self.ax.text(0.98, 1.02, "", transform=self.ax.transAxes)
 
-        anim = animation.FuncAnimation(fig, self.update_2D_PSD, frames = self.frames, interval = 20)
-        
-        writer = FFMpegWriter(fps=5)
-        anim.save(self.object.name, writer = writer)
+        save_animation(fig, self.update_2D_PSD, self.frames, self.object.name, self.object)
         plt.close()
 
     def update_2D_PSD(self, frame):
-        self.p[0].remove()
-        self.p[0] = self.ax.pcolormesh(self.KX, self.KY, self.PSD_2D_perp[frame], norm=LogNorm(vmin=1e-9, vmax=self.Max))
-        return self.p
+        return [self.heatmap.set_data(self.PSD_2D_frame(frame))]
+
+    # Full, centred plane of one frame rebuilt from the half plane
+    def PSD_2D_frame(self, frame):
+        return sp.fft.fftshift(full_plane(self.PSD_2D_perp[frame], self.x_length))
 
     def window(self):
         self.fig, self.ax = plt.subplots(1,2, figsize=(12,5))
 
-        mem_x = self.memory_space[self.object.variable + "x"]
-        mem_y = self.memory_space[self.object.variable + "y"]
-
-        shm_x = shared_memory.SharedMemory(name=mem_x["address"])
-        shm_y = shared_memory.SharedMemory(name=mem_y["address"])
-        
-        data_x = np.ndarray(mem_x["shape"], dtype=mem_x["dtype"], buffer=shm_x.buf)
-        data_y = np.ndarray(mem_y["shape"], dtype=mem_y["dtype"], buffer=shm_y.buf)
-
-        # Reshape raw data into mesh
-        data_x_mesh = data_x.reshape((self.frames, self.x_length, self.x_length))
-        data_y_mesh = data_y.reshape((self.frames, self.x_length, self.x_length))
-
-        # Fourier transfrom meshshes
-        data_x_mesh_ft = np.abs(sp.fft.fftshift(sp.fft.fft2(data_x_mesh, workers = 8, axes=(-2, -1)), axes = (-2,-1)))
-        data_y_mesh_ft = np.abs(sp.fft.fftshift(sp.fft.fft2(data_y_mesh, workers = 8, axes=(-2, -1)), axes = (-2,-1)))
-
-        # |F_perp|**2 = |F_x|**2 + |F_y|**2
-        PSD_2D_perp = data_x_mesh_ft**2 + data_y_mesh_ft**2
-
-        del data_x_mesh_ft, data_y_mesh_ft
-        
-        dx = np.diff(self.x[0:self.x_length])[0]
-
-        k_xy = 2*np.pi * sp.fft.fftshift(sp.fft.fftfreq(self.x_length, dx))
-        KX, KY = np.meshgrid(k_xy, k_xy)
-        K_perp = np.sqrt(KX**2 + KY**2)
-        K_perp = K_perp.flatten()
-
-        print(K_perp)
-        print(len(K_perp))
-
-        del k_xy, KX, KY
-
-        k_min = sorted(K_perp)[1]
-        k_max = sorted(K_perp)[-1]
-
-        print(k_min)
-        print(k_max)
-
-        #kbins = np.concatenate([np.array([0]), np.logspace(np.log10(k_min*0.1), np.log10(k_max), num=31)])
-        kbins = np.logspace(np.log10(k_min), np.log10(k_max), num=32, base=10)
-        print(kbins)
-
-        #kbins = np.arange(k_min, k_max, 16*k_max/self.x_length)
-
-        print(kbins[0])
-        print(kbins[-1])
-
-        print(len(kbins))
-
-        PSD_1D_perp_raw = np.empty((self.frames, len(kbins)-1))
-
-        for frame in range(self.frames):
-            value = PSD_2D_perp[frame].flatten()
-            PSD_1D_perp_raw[frame],_,_ = sp.stats.binned_statistic(K_perp, value, statistic="sum", bins=kbins)
-            zeros = PSD_1D_perp_raw[frame] == 0.0
-            non_zeros = zeros == False
-            PSD_1D_perp_raw[frame][0:sum(non_zeros)] = PSD_1D_perp_raw[frame][non_zeros]
-
-        self.PSD_1D_perp = PSD_1D_perp_raw[:,0:sum(non_zeros)]
-
-        del PSD_2D_perp
+        # Only the frames of the render range
+        frames = render_frames(self.object, self.frames)
+        self.first = frames.start
+        summary, computed = range_results(AnimationFourier, self.object, frames)
+        self.k_vals, self.PSD_1D_perp = computed["k_vals"], computed["PSD"]
 
         print(self.PSD_1D_perp)
 
-        Min = min(self.PSD_1D_perp.flatten())
-        Max = max(self.PSD_1D_perp.flatten())
+        # Rendered in parts, the axis limits cover the whole run
+        Min, Max = run_limits(self.object.summary or summary)["PSD"]
 
-        prot_plas_freq = np.sqrt(5e6 * (1.602176634 * 10**(-19))**2 / (8.8541878128 * 10**(-12) * 1.67262192595 * 10**(-27)))
-        self.dp = 299792458 / prot_plas_freq
-        self.k_vals = 0.5 * (kbins[1:] + kbins[:-1]) * self.dp
-        self.k_vals = self.k_vals[non_zeros]
-
-        delta_k = [2,3]
-        self.gradients = np.empty((self.frames, len(delta_k), len(self.k_vals)))
-
-        for i in range(self.frames):
-            for j, dk in enumerate(delta_k):
-                for k, k_val in enumerate(self.k_vals):
-                    window = (self.k_vals >= k_val) & (self.k_vals <= k_val * dk)
-                    k_window = self.k_vals[window]
-                    PSD_window = self.PSD_1D_perp[i][window]
-                    if len(k_window) > 1:
-                        parameters, covariance = sp.optimize.curve_fit(self.fit, np.log10(k_window), np.log10(PSD_window), maxfev=10000)
-                        #gradient = (np.log10(PSD_window[-1]) - np.log10(PSD_window[0])) / (np.log10(k_window[-1]) - np.log10(k_window[0]))
-                        self.gradients[i][j][k] = parameters[1]
-                    else:
-                        self.gradients[i][j][k] = 0
+        # Least squares slopes of log P over k...ratio*k for all frames and ratios at once
+        delta_k = self.object.slope_ratios
+        self.gradients, self.gradient_errors = local_slopes(self.k_vals, self.PSD_1D_perp, delta_k)
         
-        self.p = [self.ax[0].plot([1],[1]), self.ax[1].plot([1],[1], label=f"{delta_k[0]}"), self.ax[1].plot([1],[1], label=f"{delta_k[1]}")]
+        self.p = [self.ax[0].plot([1],[1])] + [self.ax[1].plot([1],[1], label=f"{dk}") for dk in delta_k]
+        # One standard error bands around the slopes
+        self.bands = [self.ax[1].fill_between([1], [1], [1]) for dk in delta_k]
  
         self.ax[1].set_ylim(-3,1)
         self.ax[1].set_xscale("log")
@@ -308,18 +244,18 @@ class AnimationFourier():
         self.ax[0].set_ylabel(r"{}".format(ylabel))
 
 
-        anim = animation.FuncAnimation(self.fig, self.update_window, self.frames, interval=20)
-        writer = FFMpegWriter(fps=5)
-        anim.save("window_test.mp4", writer=writer)
+        save_animation(self.fig, self.update_window, self.frames, self.object.name, self.object)
 
         #self.fig.savefig(f"mahti_sim001_window_100.jpg")
 
-    def fit(self, log_k, A, B):
-        return A + B * log_k    
-
     def update_window(self, frame):
+        frame -= self.first
         self.p[0][0].set_data(self.k_vals, self.PSD_1D_perp[frame])
-        self.p[1][0].set_data(self.k_vals, self.gradients[frame][0])
-        self.p[2][0].set_data(self.k_vals, self.gradients[frame][1])
+        for j in range(len(self.object.slope_ratios)):
+            self.p[j + 1][0].set_data(self.k_vals, self.gradients[frame][j])
+            self.bands[j].remove()
+            self.bands[j] = self.ax[1].fill_between(
+                self.k_vals, self.gradients[frame][j] - self.gradient_errors[frame][j],
+                self.gradients[frame][j] + self.gradient_errors[frame][j], color=self.p[j + 1][0].get_color(), alpha=0.2)
 
         return self.p
\ No newline at end of file
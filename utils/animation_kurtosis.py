@@ -1,13 +1,13 @@
 import os
 from configparser import ConfigParser
-import analysator as pt
 import matplotlib.pyplot as plt
-from matplotlib import animation
-from matplotlib.animation import FFMpegWriter
 import numpy as np
-from scipy.stats import kurtosis
 from multiprocessing import shared_memory
-import numexpr as ne
+from utils.geometry import Geometry
+from utils.video import save_animation, render_frames, save_data
+from utils.structure import increment_kurtosis
+from utils.shared_blocks import attach_block
+from utils.summary import frame_limits, run_limits, range_results
 
 config = ConfigParser()
 config.read(".TurbulenceBoxVisualizer.ini")
@@ -18,31 +18,40 @@ os.environ['PATH']= config["paths"]["latex_path"] + os.environ['PATH']
 os.environ['PTNOLATEX']='1'
 
 class AnimationKurtosis():
+    @staticmethod
+    def inputs(object):
+        return [(object.variable, object.component)]
+
+    # Limits and kurtosis curves of the frames (a slice of the shared blocks)
+    @staticmethod
+    def summarize(object, frames):
+        x_length = Geometry(object.geometry).x_length
+        shm, data = attach_block(object.memory_space[object.variable + object.component])
+        kurtoi = increment_kurtosis(data[frames].reshape((-1, x_length, x_length)), object.delta_ls)
+        del data
+        shm.close()
+        return {"kurtosis": frame_limits(kurtoi)}, {"kurtosis": kurtoi}
+
     def __init__(self, object):
         self.object = object
-        shm = shared_memory.SharedMemory(name=object.memory_space)
-        self.data = np.ndarray(object.shape, dtype=object.dtype, buffer=shm.buf)
+        self.memory_space = object.memory_space
 
-        self.vlsvobj = pt.vlsvfile.VlsvReader(object.bulkpath + "bulk.0000000.vlsv")
-        self.x_length = int(self.vlsvobj.read_parameter("xcells_ini"))
-        self.frames = len(self.data)
+        mem_time = self.memory_space["timepass"]
+        shm_time = shared_memory.SharedMemory(name=mem_time["address"])
+        self.time = np.ndarray(mem_time["shape"], dtype=mem_time["dtype"], buffer=shm_time.buf)
+        self.frames = len(self.time)
 
-        self.slices_pos = [i for i in range(1000)]
-        self.slice_n = len(self.slices_pos)
+        # Kurtosis of the x and y increments of every frame and lag of the render range, computed
+        # before rendering and stored next to the video, a part per range in a parallel render
+        frames = render_frames(object, self.frames)
+        self.first = frames.start
+        summary, computed = range_results(AnimationKurtosis, object, frames)
+        self.kurtoi = computed["kurtosis"]
 
-        shm_time = shared_memory.SharedMemory(name=object.time)
-        self.time = np.ndarray(object.time_shape, dtype=object.time_dtype, buffer=shm_time.buf)
+        save_data(object, time=self.time[frames.start:frames.stop], delta_ls=np.array(self.object.delta_ls), kurtosis=self.kurtoi)
 
         fig, self.ax = plt.subplots()
 
-        self.data_mesh_x = np.empty((self.frames, self.x_length, self.x_length))
-        for i in range(self.frames):
-                self.data_mesh_x[i] = self.data[i].reshape(-1, self.x_length)
-        
-        self.data_mesh_y = np.empty((self.frames, self.x_length, self.x_length))
-        for i in range(self.frames):
-                self.data_mesh_y[i] = self.data[i].reshape(-1, self.x_length).T
-
         self.ticks = []
         self.tick_labels = []
         for dl in self.object.delta_ls:
@@ -50,49 +59,27 @@ class AnimationKurtosis():
             label = f"$1/{{{dl}}}$"
             self.tick_labels.append(r"{}".format(label))
 
-        self.timelabel = self.ax.text(0.98, 1.02, "",transform=self.ax.transAxes)
-
-        anim = animation.FuncAnimation(fig, self.update, frames = self.frames, interval = 20)
-        
-        writer = FFMpegWriter(fps=5)
-        anim.save(object.name, writer=writer)
-        plt.close()
+        self.line, = self.ax.plot([], [])
 
-    def update(self,frame):
-        self.ax.clear()
-
-        delta_array_container = np.empty((len(self.object.delta_ls), 2 * self.slice_n * self.x_length))
-        
-        for i, dl in enumerate(self.object.delta_ls):
-            slices = np.empty((2 * self.slice_n, self.x_length))
-            slices[:self.slice_n] = self.data_mesh_x[frame][self.slices_pos]
-            slices[self.slice_n:] = self.data_mesh_y[frame][self.slices_pos]
-
-            slices_shifted = np.roll(slices,dl)
-
-            delta_array_container[i] = ne.evaluate('slices - slices_shifted').flatten()
-
-        """ for i in range(4):    
-            print(i,delta_array_container[i][-10:-1]) """
-        
-        kurtoi = []
-        for i in range(len(self.object.delta_ls)):
-            mean = np.mean(delta_array_container[i])
-            SD = np.std(delta_array_container[i], mean=mean)
-            delta_array_container[i] = (delta_array_container[i] - mean) / SD
-            kurtoi.append(kurtosis(delta_array_container[i], fisher=False, bias =True) - 3)
-
-        self.ax.plot(1 / np.array(self.object.delta_ls), kurtoi)
-        
         self.ax.set_xscale("log")
         xlabel = f"$\\frac{{1}}{{\\Delta l}}$"
         ylabel = f"$K$"
         self.ax.set_xlabel(r'{}'.format(xlabel))
         self.ax.set_ylabel(r'{}'.format(ylabel))
-        #self.ax.set_ylim(-2,4)
+        self.ax.set_xlim(min(self.ticks), max(self.ticks))
+        # Rendered in parts, the axis limits cover the whole run
+        Min, Max = run_limits(self.object.summary or summary)["kurtosis"]
+        self.ax.set_ylim(Min - 0.1, Max + 0.1)
 
         self.ax.set_xticks(self.ticks)
         self.ax.set_xticklabels(self.tick_labels)
 
-        self.timelabel.set_text(f"{self.time[frame]:.1f}s")
+        self.timelabel = self.ax.text(0.98, 1.02, "",transform=self.ax.transAxes)
+
+        save_animation(fig, self.update, self.frames, object.name, self.object)
+        plt.close()
 
+    def update(self,frame):
+        self.line.set_data(1 / np.array(self.object.delta_ls), self.kurtoi[frame - self.first])
+        self.timelabel.set_text(f"{self.time[frame]:.1f}s")
+        return [self.line, self.timelabel]
@@ -1,12 +1,12 @@
 import os
 from configparser import ConfigParser
-import analysator as pt
 import numpy as np
 import matplotlib.pyplot as plt
 import scipy as sp
 from multiprocessing import shared_memory
-from matplotlib import animation
-from matplotlib.animation import FFMpegWriter
+from utils.geometry import Geometry
+from utils.video import save_animation
+from utils.shared_blocks import attach_block
 
 config = ConfigParser()
 config.read(".TurbulenceBoxVisualizer.ini")
@@ -19,6 +19,15 @@ os.environ['PATH']= config["paths"]["latex_path"] + os.environ['PATH']
 os.environ['PTNOLATEX']='1'
 
 class AnimationRMS():
+    @staticmethod
+    def inputs(object):
+        if object.component in ["x","y","z","magnitude"]:
+            return [(object.variable, object.component)]
+        # The perpendicular RMS alone needs only the in-plane components
+        if object.component == "perp":
+            return [(object.variable, component) for component in ["x","y"]]
+        return [(object.variable, component) for component in ["x","y","z"]]
+
     def __init__(self, object):
         self.object = object
         if object.variable == "residual":
@@ -123,8 +132,7 @@ class AnimationRMS():
         shm_time = shared_memory.SharedMemory(name=self.object.time)
         self.time = np.ndarray(self.object.time_shape, dtype=self.object.time_dtype, buffer=shm_time.buf)
 
-        self.vlsvobj = pt.vlsvfile.VlsvReader(self.object.bulkpath + "bulk.0000000.vlsv")
-        self.x_length = int(self.vlsvobj.read_parameter("xcells_ini"))
+        self.x_length = Geometry(self.object.geometry).x_length
         self.frames = len(data)
 
         fig, self.ax = plt.subplots()
@@ -139,53 +147,48 @@ class AnimationRMS():
         self.ax.set_ylim(min([min(self.rms), min(self.rms)])*0.9, max([max(self.rms), max(self.rms)])*1.1)
         self.ax.legend()
         
-        anim = animation.FuncAnimation(fig, self.update_one, frames = self.frames + 1, interval = 20)
-        
-        writer = FFMpegWriter(fps=5)
-        anim.save(self.object.name, writer=writer)
+        save_animation(fig, self.update_one, self.frames + 1, self.object.name, self.object)
         plt.close()
 
     def update_one(self, frame):
         self.p[0][0].set_data(self.time[:frame], self.rms[:frame])
 
     def animation_all(self):
-        shm_x = shared_memory.SharedMemory(name=self.object.memory_space["x"])
-        shm_y = shared_memory.SharedMemory(name=self.object.memory_space["y"])
-        shm_z = shared_memory.SharedMemory(name=self.object.memory_space["z"])
-        data_x = np.ndarray(self.object.shape["x"], dtype=self.object.dtype, buffer=shm_x.buf)
-        data_y = np.ndarray(self.object.shape["y"], dtype=self.object.dtype, buffer=shm_y.buf)
-        data_z = np.ndarray(self.object.shape["z"], dtype=self.object.dtype, buffer=shm_z.buf)
-
-        shm_time = shared_memory.SharedMemory(name=self.object.time)
-        self.time = np.ndarray(self.object.time_shape, dtype=self.object.time_dtype, buffer=shm_time.buf)
-
-        self.vlsvobj = pt.vlsvfile.VlsvReader(self.object.bulkpath + "bulk.0000000.vlsv")
-        self.x_length = int(self.vlsvobj.read_parameter("xcells_ini"))
-        self.frames = len(data_x)
+        memory_space = self.object.memory_space
+        components = [component for variable, component in self.inputs(self.object)]
+        handles = []
+        data = {}
+        for component in components:
+            shm, data[component] = attach_block(memory_space[self.object.variable + component])
+            handles.append(shm)
+
+        shm_time, self.time = attach_block(memory_space["timepass"])
+        handles.append(shm_time)
+
+        self.x_length = Geometry(self.object.geometry).x_length
+        self.frames = len(self.time)
 
         fig, self.ax = plt.subplots()
 
         perp_label = f"${{{self.object.variable_name}}}_{{\\perp}}$"
         par_label = f"${{{self.object.variable_name}}}_{{\\parallel}}$"
 
-        self.p = [self.ax.plot([],[], label = r'{}'.format(perp_label)), self.ax.plot([],[], label = r'{}'.format(par_label))]
+        perp = np.sqrt(data["x"]**2 + data["y"]**2)
+        self.rms = [np.sqrt(np.mean(perp ** 2, axis=1) - np.mean(perp, axis=1)**2)]
+        self.p = [self.ax.plot([],[], label = r'{}'.format(perp_label))]
 
-        self.rms_par = np.sqrt(np.mean(data_z ** 2, axis=1) - np.mean(data_z, axis=1)**2)
-
-        perp = np.sqrt(data_x**2 + data_y**2)
-        self.rms_perp = np.sqrt(np.mean(perp ** 2, axis=1) - np.mean(perp, axis=1)**2)
+        if "z" in data:
+            self.rms.append(np.sqrt(np.mean(data["z"] ** 2, axis=1) - np.mean(data["z"], axis=1)**2))
+            self.p.append(self.ax.plot([],[], label = r'{}'.format(par_label)))
 
         self.ax.set_xlim(0, self.time[-1])
-        self.ax.set_ylim(min([min(self.rms_perp), min(self.rms_par)])*0.9, max([max(self.rms_perp), max(self.rms_par)])*1.1)
+        self.ax.set_ylim(min([min(rms) for rms in self.rms])*0.9, max([max(rms) for rms in self.rms])*1.1)
         self.ax.legend()
         
-        anim = animation.FuncAnimation(fig, self.update_all, frames = self.frames + 1, interval = 20)
-        
-        writer = FFMpegWriter(fps=5)
-        anim.save(self.object.name, writer=writer)
+        save_animation(fig, self.update_all, self.frames + 1, self.object.name, self.object)
         plt.close()
 
     def update_all(self,frame):
-        self.p[0][0].set_data(self.time[:frame], self.rms_perp[:frame])
-        self.p[1][0].set_data(self.time[:frame], self.rms_par[:frame])
+        for p, rms in zip(self.p, self.rms):
+            p[0].set_data(self.time[:frame], rms[:frame])
 
@@ -0,0 +1,132 @@
+import os
+from configparser import ConfigParser
+import numpy as np
+import matplotlib.pyplot as plt
+import scipy as sp
+from multiprocessing import shared_memory
+from utils.geometry import Geometry
+from utils.video import save_animation, render_frames, save_data
+from utils.heatmap import Heatmap
+from utils.spectra import RadialBinner
+from utils.structure import autocorrelation, correlation_length, map_frames
+from utils.shared_blocks import attach_block
+from utils.summary import frame_limits, run_limits, range_results
+
+config = ConfigParser()
+config.read(".TurbulenceBoxVisualizer.ini")
+
+# Telling FFMpegWriter the location of FFMpeg
+plt.rcParams['animation.ffmpeg_path'] = config["paths"]["ffmpeg_path"]
+
+#enabling use of latex
+os.environ['PATH']= config["paths"]["latex_path"] + os.environ['PATH']
+os.environ['PTNOLATEX']='1'
+
+# Second order structure function S2(l_x, l_y) for every lag of the box, its isotropic average
+# S2(l) and the correlation length, all from the autocorrelation of each frame
+class AnimationS2():
+    @staticmethod
+    def inputs(object):
+        return [(object.variable, object.component)]
+
+    # Limits, S2 maps, curves and correlation lengths of the frames (a slice of the shared blocks)
+    @staticmethod
+    def summarize(object, frames):
+        geometry = Geometry(object.geometry)
+        shm, data = attach_block(object.memory_space[object.variable + object.component])
+        S2_map, S2_iso, correlation_lengths = AnimationS2.structure_functions(
+            geometry, data[frames].reshape((-1, geometry.x_length, geometry.x_length)))
+        del data
+        shm.close()
+        summary = {"S2_map": frame_limits(S2_map), "S2_iso": frame_limits(S2_iso[:, 1:])}
+        return summary, {"S2_map": S2_map, "S2_iso": S2_iso, "correlation_length": correlation_lengths}
+
+    # Lags in cells on the periodic grid and their binning to integer |l| up to half the box
+    @staticmethod
+    def lag_bins(x_length):
+        lag = sp.fft.fftfreq(x_length, 1 / x_length)
+        LX, LY = np.meshgrid(lag, lag)
+        return lag, RadialBinner(np.sqrt(LX**2 + LY**2), np.arange(x_length // 2 + 2) - 0.5)
+
+    # S2 maps with zero lag in the middle, isotropic S2 curves and correlation lengths of the
+    # frames of data_mesh. O(N**2 log N) per frame, frames spread over the threads of this process
+    @staticmethod
+    def structure_functions(geometry, data_mesh):
+        C = np.array(map_frames(lambda frame: autocorrelation(data_mesh[frame]), len(data_mesh)))
+
+        lag, binner = AnimationS2.lag_bins(geometry.x_length)
+        C_iso = binner.reduce(C, statistic="mean")
+
+        cell = geometry.dx / geometry.dp
+        S2_iso = 2 * (C_iso[:, :1] - C_iso)
+        correlation_lengths = correlation_length(C_iso) * cell
+
+        S2_map = sp.fft.fftshift(2 * (C[:, :1, :1] - C), axes=(-2, -1))
+        return S2_map, S2_iso, correlation_lengths
+
+    def __init__(self, object):
+        self.object = object
+        self.memory_space = object.memory_space
+
+        mem_time = self.memory_space["timepass"]
+        shm_time = shared_memory.SharedMemory(name=mem_time["address"])
+        self.time = np.ndarray(mem_time["shape"], dtype=mem_time["dtype"], buffer=shm_time.buf)
+
+        self.geometry = Geometry(object.geometry)
+        self.x_length = self.geometry.x_length
+        self.frames = len(self.time)
+
+        self.cell = self.geometry.dx / self.geometry.dp
+        lag, binner = self.lag_bins(self.x_length)
+        self.lags = binner.centres * self.cell
+        self.lag_mesh = sp.fft.fftshift(lag) * self.cell
+
+        # Only the frames of the render range
+        frames = render_frames(object, self.frames)
+        self.first = frames.start
+        summary, computed = range_results(AnimationS2, object, frames)
+        self.S2_map, self.S2_iso, self.correlation_lengths = computed["S2_map"], computed["S2_iso"], computed["correlation_length"]
+
+        # S2(l) and the correlation length of every frame stored next to the video, lags in d_p
+        save_data(object, time=self.time[frames.start:frames.stop], lags=self.lags,
+                  S2_iso=self.S2_iso, correlation_length=self.correlation_lengths)
+
+        # Rendered in parts, the colour and axis limits cover the whole run
+        limits = run_limits(self.object.summary or summary)
+        self.Max = limits["S2_map"][1]
+
+        self.fig, self.axes = plt.subplots(1, 2, figsize=(13, 5))
+
+        self.heatmap = Heatmap(self.axes[0], self.lag_mesh, self.lag_mesh, self.S2_map[0], vmin=0, vmax=self.Max)
+        self.p = [self.heatmap.image]
+        self.fig.colorbar(self.heatmap.image, ax=self.axes[0])
+        self.axes[0].set_aspect("equal")
+        self.axes[0].set_xlabel(r"$\ell_x / d_p$")
+        self.axes[0].set_ylabel(r"$\ell_y / d_p$")
+        title = f"$S_2(\\ell_x, \\ell_y)$ of ${self.object.variable_name}_{{{self.object.component}}}$"
+        self.axes[0].set_title(r"{}".format(title))
+
+        self.p.append(self.axes[1].plot([], [])[0])
+        self.p.append(self.axes[1].axvline(self.correlation_lengths[0], color="k", linestyle="--"))
+        self.axes[1].set_xscale("log")
+        self.axes[1].set_yscale("log")
+        self.axes[1].set_xlim(self.lags[1], self.lags[-1])
+        self.axes[1].set_ylim(*limits["S2_iso"])
+        self.axes[1].set_xlabel(r"$\ell / d_p$")
+        self.axes[1].set_ylabel(r"$S_2(\ell)$")
+        self.axes[1].grid(True, which='both', linestyle='--', alpha=0.4)
+
+        self.timelabel = self.axes[1].text(0.98, 1.02, "", transform=self.axes[1].transAxes, ha="right")
+        self.lengthlabel = self.axes[1].text(0.02, 1.02, "", transform=self.axes[1].transAxes)
+
+        save_animation(self.fig, self.update, self.frames, object.name, self.object)
+        plt.close()
+
+    def update(self, frame):
+        self.timelabel.set_text(f"{self.time[frame]:.1f}s")
+        frame -= self.first
+        self.heatmap.set_data(self.S2_map[frame])
+        self.p[1].set_data(self.lags[1:], self.S2_iso[frame][1:])
+        self.p[2].set_xdata([self.correlation_lengths[frame]] * 2)
+        self.lengthlabel.set_text(f"$\\lambda_c = {self.correlation_lengths[frame]:.1f}\\ d_p$")
+        return self.p
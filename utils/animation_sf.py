@@ -1,13 +1,12 @@
 import os
 from configparser import ConfigParser
-import analysator as pt
 import matplotlib.pyplot as plt
-from matplotlib import animation
-from matplotlib.animation import FFMpegWriter
 import numpy as np
 from multiprocessing import shared_memory
 import seaborn as sns
-import numexpr as ne
+from utils.geometry import Geometry
+from utils.video import save_animation, render_frames
+from utils.structure import increment_pdfs
 
 config = ConfigParser()
 config.read(".TurbulenceBoxVisualizer.ini")
@@ -18,6 +17,15 @@ os.environ['PATH']= config["paths"]["latex_path"] + os.environ['PATH']
 os.environ['PTNOLATEX']='1'
 
 class AnimationSF():
+    @staticmethod
+    def inputs(object):
+        return [(object.variable, object.component)]
+
+    # The axes of the PDFs are fixed, renders in parts need no limits of the other frames
+    @staticmethod
+    def summarize(object, frames):
+        return {}, {}
+
     def __init__(self, object):
         self.object = object
         self.memory_space = object.memory_space
@@ -30,21 +38,20 @@ class AnimationSF():
         shm_time = shared_memory.SharedMemory(name=mem_time["address"])
         self.time = np.ndarray(mem_time["shape"], dtype=mem_time["dtype"], buffer=shm_time.buf)
 
-        self.vlsvobj = pt.vlsvfile.VlsvReader(object.bulkpath + "bulk.0000000.vlsv")
-        self.x_length = int(self.vlsvobj.read_parameter("xcells_ini"))
+        self.x_length = Geometry(object.geometry).x_length
         self.frames = len(self.data)
 
-        self.slices_pos = [i for i in range(self.x_length)]
-        print(self.slices_pos)
-        self.slice_n = len(self.slices_pos)
+        # PDFs of the normalized increments of every frame of the render range and lag on shared
+        # fixed bins, computed before rendering
+        frames = render_frames(object, self.frames)
+        self.first = frames.start
+        data_mesh = self.data.reshape((self.frames, self.x_length, self.x_length))
+        self.edges = np.linspace(-5, 5, 51)
+        self.densities = increment_pdfs(data_mesh[frames.start:frames.stop], self.object.delta_ls, self.edges)
 
-        self.data_mesh_x = np.empty((self.frames, self.x_length, self.x_length))
-        for i in range(self.frames):
-                self.data_mesh_x[i] = self.data[i].reshape(-1, self.x_length)
-        
-        self.data_mesh_y = np.empty((self.frames, self.x_length, self.x_length))
-        for i in range(self.frames):
-                self.data_mesh_y[i] = self.data[i].reshape(-1, self.x_length).T
+        # The increments are normalized, so the reference Gaussian is the same for every panel
+        self.x = np.linspace(-4, 4, 1000)
+        self.gaussian = 1 / np.sqrt(2 * np.pi) * np.exp(- self.x**2 / 2)
 
         self.titles = []
         for dl in self.object.delta_ls:
@@ -72,46 +79,12 @@ class AnimationSF():
             fig.delaxes(self.axes[-i])
             self.axes = np.delete(self.axes,-i)
 
-        anim = animation.FuncAnimation(fig, self.update, frames = self.frames, interval = 20)
-        
-        writer = FFMpegWriter(fps=5)
-        anim.save(object.name, writer=writer, dpi=200)
-        plt.close()
-
-    def update(self,frame):
-        for ax in self.axes:
-            ax.clear()
-
-        delta_array_container = np.empty((len(self.object.delta_ls), 2 * self.slice_n * self.x_length))
-        
-        for i, dl in enumerate(self.object.delta_ls):
-            slices = np.empty((2 * self.slice_n, self.x_length))
-            slices[:self.slice_n] = self.data_mesh_x[frame][self.slices_pos]
-            slices[self.slice_n:] = self.data_mesh_y[frame][self.slices_pos]
-
-            slices_shifted = np.roll(slices,dl)
-
-            delta_array_container[i] = ne.evaluate('slices - slices_shifted').flatten()
-
-        """ for i in range(4):    
-            print(i,delta_array_container[i][-10:-1]) """
-
+        # Artists are created once, update only changes the bar heights
+        self.bars = []
         for i, ax in enumerate(self.axes):
-            mean = np.mean(delta_array_container[i])
-            SD = np.std(delta_array_container[i])
-            delta_array_container[i] = (delta_array_container[i] - mean) / SD
-
-            ax.hist(delta_array_container[i], bins=50, density=True)
-            #sns.kdeplot(delta_array_container[i], fill=True, ax=ax)
-
-            mean = np.mean(delta_array_container[i])
-            SD = np.std(delta_array_container[i])
-            x = np.linspace(mean - 4*SD, mean + 4*SD, 1000)
-            gaussian = (1 / (SD * np.sqrt(2 * np.pi))) * np.exp(- (x - mean)**2 / (2 * SD**2))
+            self.bars.append(ax.stairs(self.densities[0][i], self.edges, fill=True))
+            ax.plot(self.x, self.gaussian)
 
-            ax.plot(x,gaussian)
-
-        for i, ax in enumerate(self.axes):
             ax.set_title(self.titles[i])
 
             x_label = f"$(\\delta {{{self.object.variable_name}}}_{{{self.object.component}}}-\\mu)/\\sigma$"
@@ -127,25 +100,12 @@ class AnimationSF():
             ax.set_yscale("log")
             ax.set_ylim(1e-3,1)
 
-        self.timelabel.set_text(f"{self.time[frame]:.1f}s")
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+        save_animation(fig, self.update, self.frames, object.name, self.object, dpi=200)
+        plt.close()
 
+    def update(self,frame):
+        for i, bars in enumerate(self.bars):
+            bars.set_data(self.densities[frame - self.first][i])
 
+        self.timelabel.set_text(f"{self.time[frame]:.1f}s")
+        return self.bars
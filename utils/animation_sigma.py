@@ -1,14 +1,18 @@
 import os
 from configparser import ConfigParser
-import analysator as pt
 import numpy as np
 import matplotlib.pyplot as plt
 import scipy as sp
 from multiprocessing import shared_memory
 from matplotlib.colors import LogNorm
-from matplotlib import animation
-from matplotlib.animation import FFMpegWriter
 from matplotlib.widgets import SpanSelector
+from utils.geometry import Geometry
+from utils.video import save_animation, render_frames
+from utils.heatmap import Heatmap
+from utils.spectra import RadialBinner
+from utils.resources import fft_workers
+from utils.shared_blocks import attach_block
+from utils.summary import frame_limits, join_summaries, run_limits, range_results
 
 config = ConfigParser()
 config.read(".TurbulenceBoxVisualizer.ini")
@@ -20,113 +24,159 @@ plt.rcParams['animation.ffmpeg_path'] = config["paths"]["ffmpeg_path"]
 os.environ['PATH']= config["paths"]["latex_path"] + os.environ['PATH'] 
 os.environ['PTNOLATEX']='1'
 
-MU_0 = 4 * np.pi * 10**(-7)
-M_P = 1.67262192595 * 10**(-27)
-
 class AnimationSigma():
+    @staticmethod
+    def inputs(object):
+        if object.animation_specific == "fourier":
+            return [(name, component) for name in ["derived/z_plus", "derived/z_minus"] for component in ["x","y","z"]]
+        return ([("proton/vg_v", component) for component in ["x","y","z"]]
+                + [("derived/b", component) for component in ["x","y","z"]]
+                + [("vg_b_vol", "z"), ("derived/Az", "pass")])
+
+    # Limits of the plotted quantities in the frames (a slice of the shared blocks) and the spectra
+    # of the fourier mode, the 2D mode computes its fields a frame at a time while drawing
+    @staticmethod
+    def summarize(object, frames):
+        geometry = Geometry(object.geometry)
+        handles = []
+        fields = []
+        for variable, component in AnimationSigma.inputs(object):
+            shm, data = attach_block(object.memory_space[variable + component])
+            handles.append(shm)
+            fields.append(data)
+        del data
+
+        if object.animation_specific == "fourier":
+            meshes = [data[frames].reshape((-1, geometry.x_length, geometry.x_length)) for data in fields]
+            k_vals, sigma_r_ft_1D, sigma_c_ft_1D = AnimationSigma.fourier_spectra(geometry, meshes[:3], meshes[3:])
+            summary = {"sigma_r": frame_limits(sigma_r_ft_1D), "sigma_c": frame_limits(sigma_c_ft_1D)}
+            computed = {"k_vals": k_vals, "sigma_r": sigma_r_ft_1D, "sigma_c": sigma_c_ft_1D}
+            del meshes
+        else:
+            # A frame at a time, the sigma fields of a whole range are never held at once
+            parts = []
+            for frame in range(frames.start, frames.stop):
+                sigmas = AnimationSigma.sigmas_2D(fields[0:3], fields[3:6], fields[6], fields[7], slice(frame, frame + 1))
+                parts.append({key: frame_limits(sigma) for key, sigma in zip(["sigma_c", "sigma_r", "sigma_m"], sigmas)})
+            summary, computed = join_summaries(parts), {}
+
+        del fields
+        for shm in handles:
+            shm.close()
+        return summary, computed
+
+    # Normalized cross helicity, residual energy and the A_z B_z product of the frames (a slice of
+    # the shared blocks) from the velocity v, the Alfvenic field b, B_z and A_z
+    @staticmethod
+    def sigmas_2D(v, b, Bz, Az, frames):
+        vx, vy, vz = [component[frames] for component in v]
+        bx, by, bz = [component[frames] for component in b]
+
+        sigma_c = 2 * (vx*bx + vy*by + vz*bz) / (vx**2+vy**2+vz**2 + bx**2+by**2+bz**2)
+        sigma_r = (vx**2+vy**2+vz**2 - bx**2-by**2-bz**2) / (vx**2+vy**2+vz**2 + bx**2+by**2+bz**2)
+        sigma_m = Az[frames] * Bz[frames]
+        return sigma_c, sigma_r, sigma_m
+
+    # Wavenumbers in units of 1/d_p and the radially summed residual energy and cross helicity
+    # spectra of every frame of the Elsasser fields z_plus and z_minus, lists of (frames, N, N) meshes
+    @staticmethod
+    def fourier_spectra(geometry, z_plus, z_minus):
+        z_p_x_ft = sp.fft.fft2(z_plus[0], workers = fft_workers(), axes=(-2, -1))
+        z_p_y_ft = sp.fft.fft2(z_plus[1], workers = fft_workers(), axes=(-2, -1))
+        z_p_z_ft = sp.fft.fft2(z_plus[2], workers = fft_workers(), axes=(-2, -1))
+
+        z_m_x_ft = sp.fft.fft2(z_minus[0], workers = fft_workers(), axes=(-2, -1))
+        z_m_y_ft = sp.fft.fft2(z_minus[1], workers = fft_workers(), axes=(-2, -1))
+        z_m_z_ft = sp.fft.fft2(z_minus[2], workers = fft_workers(), axes=(-2, -1))
+
+        E_p = 1/4*(z_p_x_ft*np.conj(z_p_x_ft)+z_p_x_ft*np.conj(z_p_x_ft)+z_p_x_ft*np.conj(z_p_x_ft))
+        E_m = 1/4*(z_m_x_ft*np.conj(z_m_x_ft)+z_m_y_ft*np.conj(z_m_y_ft)+z_m_z_ft*np.conj(z_m_z_ft))
+
+        sigma_r_ft_2D = (z_p_x_ft*np.conj(z_m_x_ft) + z_p_y_ft*np.conj(z_m_y_ft) + z_p_z_ft*np.conj(z_m_z_ft)) / (E_p + E_m)
+        sigma_c_ft_2D = 2 * (E_p - E_m) / (E_p + E_m)
+
+        del E_p, E_m
+        
+        sigma_r_ft_2D = sigma_r_ft_2D.astype(np.float64)
+        sigma_c_ft_2D = sigma_c_ft_2D.astype(np.float64)
+
+        del z_p_x_ft, z_p_y_ft, z_p_z_ft, z_m_x_ft, z_m_y_ft, z_m_z_ft
+        
+        nbins = 500
+        dx = geometry.dx
+
+        k_xy = 2 * np.pi * sp.fft.fftfreq(geometry.x_length, dx)
+        KX, KY = np.meshgrid(k_xy, k_xy)
+        K_perp = np.sqrt(KX**2 + KY**2)
+
+        del k_xy, KX, KY
+
+        binner = RadialBinner.linear(K_perp, 0, np.max(K_perp), nbins)
+
+        sigma_r_ft_1D = binner.reduce(sigma_r_ft_2D, statistic="sum")
+        sigma_c_ft_1D = binner.reduce(sigma_c_ft_2D, statistic="sum")
+
+        del sigma_r_ft_2D, sigma_c_ft_2D
+
+        return binner.centres * geometry.dp, sigma_r_ft_1D, sigma_c_ft_1D
+
     def __init__(self, object):
         self.object = object
+        self.memory_space = object.memory_space
+        self.handles = []
         memory_space = object.memory_space
         
         shm_time = shared_memory.SharedMemory(name=memory_space["timepass"]["address"])
         self.time = np.ndarray(memory_space["timepass"]["shape"], dtype=memory_space["timepass"]["dtype"], buffer=shm_time.buf)
         self.frames = len(self.time)
         
-        self.vlsvobj = pt.vlsvfile.VlsvReader(object.bulkpath + "bulk.0000000.vlsv")
-        self.cellids = self.vlsvobj.read_variable("CellID")
-
-        prot_plas_freq = np.sqrt(1e6 * (1.602176634 * 10**(-19))**2 / (8.8541878128 * 10**(-12) * 1.67262192595 * 10**(-27)))
-        dp = 299792458 / prot_plas_freq
-
-        self.x_length = int(self.vlsvobj.read_parameter("xcells_ini"))
-        coords = np.array(self.vlsvobj.get_cell_coordinates(np.sort(self.cellids))).T
-        self.x = coords[0]
-        self.y = coords[1]
-        self.x_mesh = self.x.reshape(-1,self.x_length) / dp
-        self.y_mesh = self.y.reshape(-1,self.x_length) / dp
+        self.geometry = Geometry(object.geometry)
+        self.x_length = self.geometry.x_length
+        self.x_mesh = self.geometry.x_mesh / self.geometry.dp
+        self.y_mesh = self.geometry.y_mesh / self.geometry.dp
         
-        mem_rho= memory_space["proton/vg_rho" + "pass"]
-        mem_Bx = memory_space["vg_b_vol" + "x"]
-        mem_By = memory_space["vg_b_vol" + "y"]
-        mem_Bz = memory_space["vg_b_vol" + "z"]
-        mem_vx = memory_space["proton/vg_v" + "x"]
-        mem_vy = memory_space["proton/vg_v" + "y"]
-        mem_vz = memory_space["proton/vg_v" + "z"]
-
-        shm_rho = shared_memory.SharedMemory(name=mem_rho["address"])
-        shm_Bx = shared_memory.SharedMemory(name=mem_Bx["address"])
-        shm_By = shared_memory.SharedMemory(name=mem_By["address"])
-        shm_Bz = shared_memory.SharedMemory(name=mem_Bz["address"])
-        shm_vx = shared_memory.SharedMemory(name=mem_vx["address"])
-        shm_vy = shared_memory.SharedMemory(name=mem_vy["address"])
-        shm_vz = shared_memory.SharedMemory(name=mem_vz["address"])
-
-        rho = np.ndarray(mem_rho["shape"], dtype = mem_rho["dtype"], buffer = shm_rho.buf) * M_P
-        self.Bx = np.ndarray(mem_Bx["shape"], dtype = mem_Bx["dtype"], buffer = shm_Bx.buf)
-        self.By = np.ndarray(mem_By["shape"], dtype = mem_By["dtype"], buffer = shm_By.buf)
-        self.Bz = np.ndarray(mem_Bz["shape"], dtype = mem_Bz["dtype"], buffer = shm_Bz.buf)
-        self.bx = self.Bx / np.sqrt(MU_0 * rho)
-        self.by = self.By / np.sqrt(MU_0 * rho)
-        self.bz = self.Bz / np.sqrt(MU_0 * rho)
-        self.vx = np.ndarray(mem_vx["shape"], dtype = mem_vx["dtype"], buffer = shm_vx.buf)
-        self.vy = np.ndarray(mem_vy["shape"], dtype = mem_vy["dtype"], buffer = shm_vy.buf)
-        self.vz = np.ndarray(mem_vz["shape"], dtype = mem_vz["dtype"], buffer = shm_vz.buf)
-
         if object.animation_specific == "2D":
             self.animation_2D()
         elif object.animation_specific == "fourier":
             self.animation_fourier()
 
-    def animation_2D(self):
-        sigma_c = 2 * (self.vx*self.bx + self.vy*self.by + self.vz*self.bz) / (self.vx**2+self.vy**2+self.vz**2 + self.bx**2+self.by**2+self.bz**2)
-        sigma_r = (self.vx**2+self.vy**2+self.vz**2 - self.bx**2-self.by**2-self.bz**2) / (self.vx**2+self.vy**2+self.vz**2 + self.bx**2+self.by**2+self.bz**2)
-        self.sigma_c = sigma_c.reshape((self.frames, self.x_length, self.x_length))
-        self.sigma_r = sigma_r.reshape((self.frames, self.x_length, self.x_length))
-
-        del self.bx, self.by, self.bz
-
-        dx = np.diff(self.x[0:self.x_length])[0]
+    # Attach to the shared blocks of the given variable-component pairs
+    def attach(self, variable_components):
+        arrays = []
+        for variable, component in variable_components:
+            mem = self.memory_space[variable + component]
+            shm = shared_memory.SharedMemory(name=mem["address"])
+            self.handles.append(shm)
+            arrays.append(np.ndarray(mem["shape"], dtype = mem["dtype"], buffer = shm.buf))
+        return arrays
 
-        kx = 2*np.pi*np.fft.fftfreq(self.x_length, d=dx)
-        ky = 2*np.pi*np.fft.fftfreq(self.x_length, d=dx)
-        KX, KY = np.meshgrid(kx, ky)
-        K2 = KX**2 + KY**2
-
-        Bx_mesh = self.Bx.reshape((self.frames, self.x_length, self.x_length))
-        By_mesh = self.By.reshape((self.frames, self.x_length, self.x_length))
-        Bz_mesh = self.Bz.reshape((self.frames, self.x_length, self.x_length))
-
-        Bx_hat = np.fft.fft2(Bx_mesh, axes=(-2, -1))
-        By_hat = np.fft.fft2(By_mesh, axes=(-2, -1))
-
-        num = 1j * (KY*Bx_hat - KX*By_hat)
-        Az_hat = np.empty((self.frames, self.x_length, self.x_length), dtype=complex)
-        mask = K2 != 0
-        for frame in range(self.frames):
-            Az_hat[frame][mask] = -num[frame][mask] / K2[mask]
-            Az_hat[frame][~mask] = 0
+    def animation_2D(self):
+        self.v = self.attach([("proton/vg_v", component) for component in ["x","y","z"]])
+        self.b = self.attach([("derived/b", component) for component in ["x","y","z"]])
+        self.Bz, self.Az = self.attach([("vg_b_vol", "z"), ("derived/Az", "pass")])
 
-        Az = np.fft.ifft2(Az_hat, axes = (-2, -1)).real
-        self.sigma_m = Az * Bz_mesh
+        # The sigma fields are computed a frame at a time by update, rendered in parts the colour
+        # limits cover the whole run
+        limits = run_limits(self.object.summary or self.summarize(self.object, slice(0, self.frames))[0])
 
-        self.Min_c = round(np.min(self.sigma_c.ravel()), 10)
-        self.Max_c = round(np.max(self.sigma_c.ravel()), 10)
+        self.Min_c = round(limits["sigma_c"][0], 10)
+        self.Max_c = round(limits["sigma_c"][1], 10)
 
         if (np.abs(self.Min_c) > np.abs(self.Max_c)):
             self.Max_c = - self.Min_c
         else:
             self.Min_c = - self.Max_c
         
-        self.Min_r = round(np.min(self.sigma_r.ravel()), 10)
-        self.Max_r = round(np.max(self.sigma_r.ravel()), 10)
+        self.Min_r = round(limits["sigma_r"][0], 10)
+        self.Max_r = round(limits["sigma_r"][1], 10)
 
         if (np.abs(self.Min_r) > np.abs(self.Max_r)):
             self.Max_r = - self.Min_r
         else:
             self.Min_r = - self.Max_r
 
-        self.Min_m = np.min(self.sigma_m.ravel())
-        self.Max_m = np.max(self.sigma_m.ravel())
+        self.Min_m = limits["sigma_m"][0]
+        self.Max_m = limits["sigma_m"][1]
 
         if (np.abs(self.Min_m) > np.abs(self.Max_m)):
             self.Max_m = - self.Min_m
@@ -135,106 +185,49 @@ class AnimationSigma():
 
         fig, self.axes = plt.subplots(1, 3, figsize = (26, 8))
         
-        self.p = [
-            self.axes[0].pcolormesh(self.x_mesh, self.y_mesh, self.sigma_c[0], cmap = "bwr", vmin = self.Min_c, vmax = self.Max_c),
-            self.axes[1].pcolormesh(self.x_mesh, self.y_mesh, self.sigma_r[0], cmap = "bwr", vmin = self.Min_r, vmax = self.Max_r),
-            self.axes[2].pcolormesh(self.x_mesh, self.y_mesh, self.sigma_m[0], cmap = "bwr", vmin = self.Min_m, vmax = self.Max_m)
+        sigma_c, sigma_r, sigma_m = self.sigmas_2D_frame(0)
+        self.heatmaps = [
+            Heatmap(self.axes[0], self.x_mesh, self.y_mesh, sigma_c, cmap = "bwr", vmin = self.Min_c, vmax = self.Max_c),
+            Heatmap(self.axes[1], self.x_mesh, self.y_mesh, sigma_r, cmap = "bwr", vmin = self.Min_r, vmax = self.Max_r),
+            Heatmap(self.axes[2], self.x_mesh, self.y_mesh, sigma_m, cmap = "bwr", vmin = self.Min_m, vmax = self.Max_m)
         ]
 
-        anim = animation.FuncAnimation(fig, self.update_2D, self.frames, interval = 20)
-        writer = FFMpegWriter(fps=5)
-        anim.save("Animations/test/sigma_trial.mp4", writer=writer)
+        save_animation(fig, self.update_2D, self.frames, self.object.name, self.object)
         plt.close()
 
+    # sigma_c, sigma_r and sigma_m of one frame as (x, y) meshes
+    def sigmas_2D_frame(self, frame):
+        return [
+            sigma.reshape((self.x_length, self.x_length))
+            for sigma in self.sigmas_2D(self.v, self.b, self.Bz, self.Az, slice(frame, frame + 1))]
+
     def update_2D(self, frame):
-        for i in range(3):
-            self.p[i].remove()
         #self.timelabel.set_text(f"{self.time[frame]:.1f}s")
-        self.p = [
-            self.axes[0].pcolormesh(self.x_mesh, self.y_mesh, self.sigma_c[frame], cmap = "bwr", vmin=self.Min_c, vmax=self.Max_c),
-            self.axes[1].pcolormesh(self.x_mesh, self.y_mesh, self.sigma_r[frame], cmap = "bwr", vmin=self.Min_r, vmax=self.Max_r),
-            self.axes[2].pcolormesh(self.x_mesh, self.y_mesh, self.sigma_m[frame], cmap = "bwr", vmin=self.Min_m, vmax=self.Max_m)
+        return [
+            heatmap.set_data(sigma)
+            for heatmap, sigma in zip(self.heatmaps, self.sigmas_2D_frame(frame))
         ]
-        return self.p
 
     def animation_fourier(self):
-        bx_mesh = self.bx.reshape((self.frames, self.x_length, self.x_length))
-        by_mesh = self.by.reshape((self.frames, self.x_length, self.x_length))
-        Bz_mesh = self.bz.reshape((self.frames, self.x_length, self.x_length))
-
-        vx_mesh = self.vx.reshape((self.frames, self.x_length, self.x_length))
-        vy_mesh = self.vy.reshape((self.frames, self.x_length, self.x_length))
-        vz_mesh = self.vz.reshape((self.frames, self.x_length, self.x_length))
-
-        z_p_x = vx_mesh + bx_mesh
-        z_p_y = vy_mesh + by_mesh
-        z_p_z = vz_mesh + Bz_mesh
-
-        z_m_x = vx_mesh - bx_mesh
-        z_m_y = vy_mesh - by_mesh
-        z_m_z = vz_mesh - Bz_mesh
-
-        z_p_x_ft = sp.fft.fft2(z_p_x, workers = 8, axes=(-2, -1))
-        z_p_y_ft = sp.fft.fft2(z_p_y, workers = 8, axes=(-2, -1))
-        z_p_z_ft = sp.fft.fft2(z_p_z, workers = 8, axes=(-2, -1))
-
-        z_m_x_ft = sp.fft.fft2(z_m_x, workers = 8, axes=(-2, -1))
-        z_m_y_ft = sp.fft.fft2(z_m_y, workers = 8, axes=(-2, -1))
-        z_m_z_ft = sp.fft.fft2(z_m_z, workers = 8, axes=(-2, -1))
-
-        del z_p_x, z_p_y, z_p_z, z_m_x, z_m_y, z_m_z
-
-        E_p = 1/4*(z_p_x_ft*np.conj(z_p_x_ft)+z_p_x_ft*np.conj(z_p_x_ft)+z_p_x_ft*np.conj(z_p_x_ft))
-        E_m = 1/4*(z_m_x_ft*np.conj(z_m_x_ft)+z_m_y_ft*np.conj(z_m_y_ft)+z_m_z_ft*np.conj(z_m_z_ft))
-
-        sigma_r_ft_2D = (z_p_x_ft*np.conj(z_m_x_ft) + z_p_y_ft*np.conj(z_m_y_ft) + z_p_z_ft*np.conj(z_m_z_ft)) / (E_p + E_m)
-        sigma_c_ft_2D = 2 * (E_p - E_m) / (E_p + E_m)
-
-        del E_p, E_m
-        
-        sigma_r_ft_2D = sigma_r_ft_2D.astype(np.float64)
-        sigma_c_ft_2D = sigma_c_ft_2D.astype(np.float64)
-
-        del z_p_x_ft, z_p_y_ft, z_p_z_ft, z_m_x_ft, z_m_y_ft, z_m_z_ft
-        
-        nbins = 500
-        dx = np.diff(self.x[0:self.x_length])[0]
-
-        k_xy = 2 * np.pi * sp.fft.fftfreq(self.x_length, dx)
-        KX, KY = np.meshgrid(k_xy, k_xy)
-        K_perp = np.sqrt(KX**2 + KY**2)
-
-        del k_xy, KX, KY
-
-        k_bin_edges = np.linspace(0, np.max(K_perp), num = nbins + 1) 
-        bin_idx = np.digitize(K_perp.ravel(), k_bin_edges) - 1
-        bin_idx = np.clip(bin_idx, 0, nbins - 1)
-
-        self.sigma_r_ft_1D = np.empty((self.frames, nbins))
-        self.sigma_c_ft_1D = np.empty((self.frames, nbins))
-        
-        for frame in range(self.frames):
-            self.sigma_r_ft_1D[frame] = np.bincount(bin_idx, weights = sigma_r_ft_2D[frame].ravel(), minlength=nbins)
-            self.sigma_c_ft_1D[frame] = np.bincount(bin_idx, weights = sigma_c_ft_2D[frame].ravel(), minlength=nbins)
-
-        del sigma_r_ft_2D, sigma_c_ft_2D
+        # Spectra of the Elsasser variables z+- = v +- b of the shared derived field engine, only
+        # for the frames of the render range
+        frames = render_frames(self.object, self.frames)
+        self.first = frames.start
+        summary, computed = range_results(AnimationSigma, self.object, frames)
+        self.k_vals, self.sigma_r_ft_1D, self.sigma_c_ft_1D = computed["k_vals"], computed["sigma_r"], computed["sigma_c"]
 
         #self.sigma_r_ft_1D *= (dx*dx) / (nbins*nbins)
         #self.sigma_c_ft_1D *= (dx*dx) / (nbins*nbins)
 
-        Min_r = min(self.sigma_r_ft_1D.flatten())
-        Max_r = max(self.sigma_r_ft_1D.flatten())
-        Min_c = min(self.sigma_c_ft_1D.flatten())
-        Max_c = max(self.sigma_c_ft_1D.flatten())
+        # Rendered in parts, the axis limits cover the whole run
+        limits = run_limits(self.object.summary or summary)
+        Min_r, Max_r = limits["sigma_r"]
+        Min_c, Max_c = limits["sigma_c"]
 
         fig, self.axes = plt.subplots(1,2, figsize=(16,8))
 
         self.p = [self.axes[0].plot([], []), self.axes[1].plot([],[])]
 
-        prot_plas_freq = np.sqrt(1e6 * (1.602176634 * 10**(-19))**2 / (8.8541878128 * 10**(-12) * 1.67262192595 * 10**(-27)))
-        self.dp = 299792458 / prot_plas_freq
-        self.k_vals = 0.5 * (k_bin_edges[1:] + k_bin_edges[:-1]) * self.dp
-
         self.axes[0].set_xscale("log")
         #self.axes[0].set_yscale("log")
         self.axes[1].set_xscale("log")
@@ -253,14 +246,11 @@ class AnimationSigma():
 
         #self.timelabel = self.ax.text(0.98, 1.02, "", transform=self.ax.transAxes)
 
-        anim = animation.FuncAnimation(fig, self.update_fourier, frames = self.frames, interval = 20)
-        
-        writer = FFMpegWriter(fps=5)
-        anim.save("Animations/test/sigma_fft_trial.mp4", writer = writer)
+        save_animation(fig, self.update_fourier, self.frames, self.object.name, self.object)
         plt.close()
 
     def update_fourier(self, frame):
-        self.p[0][0].set_data(self.k_vals, self.sigma_r_ft_1D[frame])
-        self.p[1][0].set_data(self.k_vals, self.sigma_c_ft_1D[frame])
+        self.p[0][0].set_data(self.k_vals, self.sigma_r_ft_1D[frame - self.first])
+        self.p[1][0].set_data(self.k_vals, self.sigma_c_ft_1D[frame - self.first])
         #self.timelabel.set_text(f"{self.time[frame]:.1f}s")
         return self.p
@@ -6,6 +6,9 @@ config.read(".TurbulenceBoxVisualizer.ini")
 
 bulkpath = config["paths"]["bulkpath"]
 outputpath = config["settings"]["output_dir"]
+# Preview runs write next to the real output, into <output_dir>_preview/
+if config["settings"].getboolean("preview", fallback=False):
+    outputpath = outputpath.rstrip("/") + "_preview/"
 _, simname, _ = outputpath.split("/")
 
 filetype = config["settings"]["filetype"]
@@ -32,6 +35,11 @@ class AnimationSpecs():
         if animation_type == "fourier":
             if animation_specific[0] in ["1D", "2D", "window"]:
                 self.fourier_type = animation_specific[0]
+                # Window ratios of the local slope fits of the window mode
+                if len(animation_specific) > 1:
+                    self.slope_ratios = list(animation_specific[1])
+                else:
+                    self.slope_ratios = [2, 3]
 
             else:
                 print("fourier spec defined incorrectly")
@@ -41,6 +49,8 @@ class AnimationSpecs():
             self.delta_ls = animation_specific
 
         self.animation_type = animation_type
+        # The config entry as given, part of the manifest fingerprint
+        self.spec = (animation_type, variable, component, animation_specific)
 
         if animation_type not in ["franci", "sigma"]:
             self.variable = translate[variable][0]
@@ -57,6 +67,23 @@ class AnimationSpecs():
 
         self.bulkpath = bulkpath
         self.memory_space = {}
+        # Per-frame limits of the whole run when the animation is rendered in parts, see utils/summary.py
+        self.summary = {}
+        # Shared blocks of the arrays the summary pass computed for the render range, see utils/summary.py
+        self.computed = {}
+        self.geometry = {}
+
+        # Frame range and segment index of a parallel render, and the files written by the animation
+        self.render_range = None
+        self.render_segment = 0
+        self.rendered = []
+
+        # Manifest fingerprint of the run, keys the directory of reusable frame files
+        self.fingerprint = ""
+
+        # Streaming window the animation is rendered in and the run index of its first frame
+        self.window = None
+        self.frame_offset = 0
 
         if variable == "rho":
             name = f"{outputpath}{simname}_{animation_type}_{self.variable_name}{filetype}"
@@ -72,7 +99,14 @@ class AnimationSpecs():
             
         elif animation_type == "sf":
             name = f"{outputpath}{simname}_{animation_type}_{self.variable_name}_{component}_{self.delta_ls[0]}-{self.delta_ls[-1]}{filetype}"
-        
+
+        elif animation_type == "franci":
+            # A still image of the whole run
+            name = f"{outputpath}{simname}_{animation_type}_{self.variable_name}_{component}.jpg"
+
+        elif animation_type == "sigma":
+            name = f"{outputpath}{simname}_{animation_type}_{self.animation_specific}{filetype}"
+
         else:
             name = f"{outputpath}{simname}_{animation_type}_{self.variable_name}_{component}{filetype}"
         
@@ -1,11 +1,13 @@
 import os
 from configparser import ConfigParser
-import analysator as pt
 import numpy as np
 import matplotlib.pyplot as plt
 from multiprocessing import shared_memory
-from matplotlib import animation
-from matplotlib.animation import FFMpegWriter
+from utils.geometry import Geometry
+from utils.video import save_animation
+from utils.heatmap import Heatmap
+from utils.shared_blocks import attach_block
+from utils.summary import frame_limits, run_limits
 
 config = ConfigParser()
 config.read(".TurbulenceBoxVisualizer.ini")
@@ -18,6 +20,32 @@ os.environ['PATH']= config["paths"]["latex_path"] + os.environ['PATH']
 os.environ['PTNOLATEX']='1'
 
 class AnimationTriple():
+    @staticmethod
+    def inputs(object):
+        inputs = [(object.variable, component) for component in ["x","y","z"]]
+        if object.unitless == True:
+            inputs.append((object.variable, "magnitude"))
+        return inputs
+
+    # Limits of the plotted components in the frames (a slice of the shared blocks) for renders in parts
+    @staticmethod
+    def summarize(object, frames):
+        if object.unitless == True:
+            shm_norm, mag = attach_block(object.memory_space[object.variable + "magnitude"])
+            scale = np.mean(mag[frames], axis=1).reshape((-1, 1))
+            del mag
+            shm_norm.close()
+        else:
+            scale = object.unit
+
+        summary = {}
+        for component in ["x","y","z"]:
+            shm, data = attach_block(object.memory_space[object.variable + component])
+            summary[component] = frame_limits(data[frames]) / scale
+            del data
+            shm.close()
+        return summary, {}
+
     def __init__(self, object):
         self.object = object
         self.memory_space = object.memory_space
@@ -37,20 +65,18 @@ class AnimationTriple():
         shm_time = shared_memory.SharedMemory(name=self.memory_space["timepass"]["address"])
         self.time = np.ndarray(self.memory_space["timepass"]["shape"], dtype=self.memory_space["timepass"]["dtype"], buffer=shm_time.buf)
 
-        prot_plas_freq = np.sqrt(1e6 * (1.602176634 * 10**(-19))**2 / (8.8541878128 * 10**(-12) * 1.67262192595 * 10**(-27)))
-        dp = 299792458 / prot_plas_freq
-
-        self.vlsvobj = pt.vlsvfile.VlsvReader(object.bulkpath + "bulk.0000000.vlsv")
-        self.cellids = self.vlsvobj.read_variable("CellID")
-
-        self.x_length = self.vlsvobj.read_parameter("xcells_ini")
-        coords = np.array(self.vlsvobj.get_cell_coordinates(np.sort(self.cellids))).T
-        x = coords[0]
-        y = coords[1]
-        self.x_mesh = x.reshape(-1,self.x_length) / dp
-        self.y_mesh = y.reshape(-1,self.x_length) / dp
+        self.geometry = Geometry(object.geometry)
+        self.x_length = self.geometry.x_length
+        self.x_mesh = self.geometry.x_mesh / self.geometry.dp
+        self.y_mesh = self.geometry.y_mesh / self.geometry.dp
         self.frames = len(self.data_x)
 
+        # Views of the shared blocks, scaled a frame at a time by update so that only the frames
+        # of the render range are read
+        self.data_mesh_x = self.data_x.reshape((self.frames, self.x_length, self.x_length))
+        self.data_mesh_y = self.data_y.reshape((self.frames, self.x_length, self.x_length))
+        self.data_mesh_z = self.data_z.reshape((self.frames, self.x_length, self.x_length))
+
         if object.unitless == True:
             self.animation_unitless()
         else:
@@ -59,35 +85,26 @@ class AnimationTriple():
     def animation_unitless(self):
         mem_norm = self.memory_space[self.object.variable + "magnitude"]
         shm_norm = shared_memory.SharedMemory(name=mem_norm["address"])
-        mag = np.ndarray(mem_norm["shape"], dtype=mem_norm["dtype"], buffer=shm_norm.buf)
-
-        mag_average = np.mean(mag, axis=1).reshape((self.frames, 1))
-
-        unitless_data_x = self.data_x / mag_average
-        unitless_data_y = self.data_y / mag_average
-        unitless_data_z = self.data_z / mag_average
+        self.mag = np.ndarray(mem_norm["shape"], dtype=mem_norm["dtype"], buffer=shm_norm.buf)
 
         fig, self.axes = plt.subplots(1,3, figsize=(26,8))
         fig.tight_layout(pad=4.0)
 
-        self.Min = round(min(np.array([unitless_data_x,unitless_data_y,unitless_data_z]).flatten()), 20)
-        self.Max = round(max(np.array([unitless_data_x,unitless_data_y,unitless_data_z]).flatten()), 20)
+        # Rendered in parts, the colour limits cover the whole run
+        limits = run_limits(self.object.summary or self.summarize(self.object, slice(0, self.frames))[0])
+        self.Min = round(min(limits[component][0] for component in ["x","y","z"]), 20)
+        self.Max = round(max(limits[component][1] for component in ["x","y","z"]), 20)
 
         if abs(self.Min) > abs(self.Max):
             self.Max = -self.Min
         else:
             self.Min = -self.Max
 
-        self.data_mesh_x = unitless_data_x.reshape((self.frames, self.x_length, self.x_length))
-        self.data_mesh_y = unitless_data_y.reshape((self.frames, self.x_length, self.x_length))
-        self.data_mesh_z = unitless_data_z.reshape((self.frames, self.x_length, self.x_length))
-
-        self.p = [
-            self.axes[0].pcolormesh(self.x_mesh, self.y_mesh, self.data_mesh_x[0], cmap = "bwr", vmin=self.Min, vmax=self.Max),
-            self.axes[1].pcolormesh(self.x_mesh, self.y_mesh, self.data_mesh_y[0], cmap = "bwr", vmin=self.Min, vmax=self.Max),
-            self.axes[2].pcolormesh(self.x_mesh, self.y_mesh, self.data_mesh_z[0], cmap = "bwr", vmin=self.Min, vmax=self.Max)
+        self.heatmaps = [
+            Heatmap(self.axes[i], self.x_mesh, self.y_mesh, data_mesh[0] / self.scale(0), cmap = "bwr", vmin=self.Min, vmax=self.Max)
+            for i, data_mesh in enumerate([self.data_mesh_x, self.data_mesh_y, self.data_mesh_z])
             ]
-        cbar = fig.colorbar(self.p[2], ax=self.axes, fraction=0.02, pad=0.01)
+        cbar = fig.colorbar(self.heatmaps[2].image, ax=self.axes, fraction=0.02, pad=0.01)
         components = ["x","y","z"]
 
         for i in range(3):
@@ -98,34 +115,28 @@ class AnimationTriple():
 
         self.timelabel = self.axes[2].text(0.98, 1.02, "",transform=self.axes[2].transAxes, fontsize = 16)
 
-        anim = animation.FuncAnimation(fig, self.update, frames = self.frames, interval = 20)
-
-        writer = FFMpegWriter(fps=5)
-        anim.save(self.object.name, writer = writer)
+        save_animation(fig, self.update, self.frames, self.object.name, self.object, heatmaps=self.heatmaps)
         plt.close()
 
     def animation_unit(self):
         fig, self.axes = plt.subplots(1,3, figsize=(26,8))
         fig.tight_layout(pad=4.0)
 
-        self.Min = np.min(np.array([self.data_x,self.data_y,self.data_z]).flatten()) / self.object.unit
-        self.Max = np.max(np.array([self.data_x,self.data_y,self.data_z]).flatten()) / self.object.unit
+        # Rendered in parts, the colour limits cover the whole run
+        limits = run_limits(self.object.summary or self.summarize(self.object, slice(0, self.frames))[0])
+        self.Min = min(limits[component][0] for component in ["x","y","z"])
+        self.Max = max(limits[component][1] for component in ["x","y","z"])
 
         if abs(self.Min) > abs(self.Max):
             self.Max = -self.Min
         else:
             self.Min = -self.Max
 
-        self.data_mesh_x = self.data_x.reshape((self.frames, self.x_length, self.x_length)) / self.object.unit
-        self.data_mesh_y = self.data_y.reshape((self.frames, self.x_length, self.x_length)) / self.object.unit
-        self.data_mesh_z = self.data_z.reshape((self.frames, self.x_length, self.x_length)) / self.object.unit
-
-        self.p = [
-            self.axes[0].pcolormesh(self.x_mesh, self.y_mesh, self.data_mesh_x[0], cmap = "bwr", vmin=self.Min, vmax=self.Max),
-            self.axes[1].pcolormesh(self.x_mesh, self.y_mesh, self.data_mesh_y[0], cmap = "bwr", vmin=self.Min, vmax=self.Max),
-            self.axes[2].pcolormesh(self.x_mesh, self.y_mesh, self.data_mesh_z[0], cmap = "bwr", vmin=self.Min, vmax=self.Max)
+        self.heatmaps = [
+            Heatmap(self.axes[i], self.x_mesh, self.y_mesh, data_mesh[0] / self.scale(0), cmap = "bwr", vmin=self.Min, vmax=self.Max)
+            for i, data_mesh in enumerate([self.data_mesh_x, self.data_mesh_y, self.data_mesh_z])
             ]
-        cbar = fig.colorbar(self.p[2], ax=self.axes, fraction=0.02, pad=0.01)
+        cbar = fig.colorbar(self.heatmaps[2].image, ax=self.axes, fraction=0.02, pad=0.01)
         cbar.set_label(r'{}'.format(self.object.unit_name), rotation = 0, fontsize=12, va="top")
         cbar.ax.xaxis.set_label_position("top")
         components = ["x","y","z"]
@@ -138,36 +149,20 @@ class AnimationTriple():
         
         self.timelabel = self.axes[2].text(0.98, 1.02, "",transform=self.axes[2].transAxes, fontsize = 16)
 
-        anim = animation.FuncAnimation(fig, self.update, frames = self.frames, interval = 20)
-
-        writer = FFMpegWriter(fps=5)
-        anim.save(self.object.name, writer = writer)
+        save_animation(fig, self.update, self.frames, self.object.name, self.object, heatmaps=self.heatmaps)
         plt.close()
 
+    # Divisor of the components in a frame: the mean magnitude, or the unit
+    def scale(self, frame):
+        if self.object.unitless == True:
+            return np.mean(self.mag[frame])
+        return self.object.unit
+
     def update(self,frame):
-        for i in range(3):
-            self.p[i].remove()
         self.timelabel.set_text(f"{self.time[frame]:.1f}s")
-        self.p = [
-            self.axes[0].pcolormesh(self.x_mesh, self.y_mesh, self.data_mesh_x[frame], cmap = "bwr", vmin=self.Min, vmax=self.Max),
-            self.axes[1].pcolormesh(self.x_mesh, self.y_mesh, self.data_mesh_y[frame], cmap = "bwr", vmin=self.Min, vmax=self.Max),
-            self.axes[2].pcolormesh(self.x_mesh, self.y_mesh, self.data_mesh_z[frame], cmap = "bwr", vmin=self.Min, vmax=self.Max)
+        scale = self.scale(frame)
+        images = [
+            heatmap.set_data(data_mesh[frame] / scale)
+            for heatmap, data_mesh in zip(self.heatmaps, [self.data_mesh_x, self.data_mesh_y, self.data_mesh_z])
         ]
-        return self.p
-    
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+        return images + [self.timelabel]
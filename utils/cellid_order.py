@@ -0,0 +1,22 @@
+import hashlib
+import numpy as np
+
+# Sort permutation of the CellIDs of a bulkfile. The argsort is computed once and reused
+# for every later frame with the same CellID layout, which is recognised from a hash.
+class CellIDOrder():
+    def __init__(self):
+        self.digest = None
+        self.order = None
+
+    def __call__(self, cellids):
+        cellids = np.asarray(cellids)
+
+        # Already in order, nothing to permute
+        if np.all(cellids[1:] > cellids[:-1]):
+            return slice(None)
+
+        digest = hashlib.blake2b(cellids.tobytes(), digest_size=16).digest()
+        if digest != self.digest:
+            self.order = cellids.argsort()
+            self.digest = digest
+        return self.order
@@ -19,6 +19,8 @@ config["paths"] = {
 #   - kurtosis: kurtosis of given variable.
 #   - diagnostics: figure of allotment of different variables.
 #   - reconnection: 2D heat map of B_perp or J_z with A_z isolines on top and x and o points.
+#   - s2: second order structure function S2(l_x, l_y) over every lag, its isotropic average S2(l) and the correlation length.
+#     S2(l) and the correlation length of every frame are also saved next to the video as <output name>.npz.
 #
 # <variable>: "B", "v", "J", "rho".
 #
@@ -32,11 +34,14 @@ config["paths"] = {
 #   - fourier:
 #       - ["1D"] for 1 dimensional PSD
 #       - ["2D"] for 2 dimensional PSD
-#       - ["window"] for a snapshot of the 1D psd to check slope
+#       - ["window"] for a snapshot of the 1D psd to check slope, local slopes are fitted over k...2k and k...3k.
+#         Other window ratios can be given as ["window", [1.5, 2, 4]].
 #
 #   - sf: a list like [2,4,6...] which states the dl in cells for structure function.
 #
 #   - kurtosis: again a list like [2,4,6...].
+#
+#   - s2: not used, e.g. "".
 
 config["settings"] = {
     "start_frame" : 50,
@@ -58,7 +63,66 @@ config["settings"] = {
                     #("2D", "J", "z", ["unit"]),
             ],
 
-    "filetype" : ".mp4"
+    "filetype" : ".mp4",
+
+    # Cores shared by all pool processes and the FFT/BLAS/numexpr threads inside them, 0 uses every available core.
+    # Limiting the BLAS and OpenMP threads of each pool process needs the optional threadpoolctl package.
+    "cores" : 0,
+
+    # Parallel rendering: split every animation's frames into up to render_segments contiguous ranges,
+    # render them in separate processes and join the segments losslessly (1 renders serially). 0 renders
+    # videos serially and writes frame files (output_mode "frames") with one range per core.
+    "render_segments" : 0,
+
+    # Renderer of the 2D, triple and reconnection heat maps: "matplotlib" draws the whole figure every frame,
+    # "raw" draws it once and pipes the coloured fields with the changed labels and contours straight to ffmpeg.
+    "renderer" : "matplotlib",
+
+    # Heat maps showing more cells inside their axis limits than their axes have pixels are reduced in blocks before
+    # drawing (lod = False draws every cell). lod_reduction "mean" averages each block, "maxabs" keeps its value of
+    # largest magnitude.
+    "lod" : True,
+    "lod_reduction" : "mean",
+
+    # Output mode: "video" saves every animation as one video, "frames" writes numbered frame_format ("png" or "webp")
+    # files into <output name>_frames/<fingerprint>/, split into render_segments ranges like the videos. Frames already
+    # on disk from a run with the same inputs, settings and code are skipped, so an interrupted run can simply be
+    # restarted; frames of other runs are removed. Streaming windows number their frames over the whole run.
+    # encode_frames assembles the video from the frame files once every frame is written.
+    "output_mode" : "video",
+    "frame_format" : "png",
+    "encode_frames" : True,
+
+    # Skip animations whose bulkfiles, frame range, entry, other settings and code are unchanged since they were
+    # last produced and whose output still exists. The fingerprints are kept in <output_dir>.manifest.json.
+    "skip_unchanged" : True,
+
+    # Preview mode: a quick look at every animation from every preview_stride:th bulkfile, on a grid coarsened by
+    # block means of preview_coarsen x preview_coarsen cells, written to <output_dir>_preview/.
+    "preview" : False,
+    "preview_stride" : 10,
+    "preview_coarsen" : 4,
+
+    # Streaming mode: process the run in windows of window_frames frames (0 loads everything at once).
+    # The axis and colour limits of every window come from a pre-pass over every prepass_stride:th frame, values of
+    # the frames in between beyond them are clipped. rms and franci need the whole run.
+    "window_frames" : 0,
+    "prepass_stride" : 10,
+
+    # Storage precision of the shared memory blocks: "float64" or "float32".
+    # precision_per_variable overrides it for single vlsv variables, e.g. {"vg_b_vol": "float32"}.
+    # precision_check prints the maximum relative deviation of PSDs and kurtosis curves of float32 variables from float64.
+    "precision" : "float64",
+    "precision_per_variable" : {},
+    "precision_check" : False
+}
+
+# On-disk cache of fetched fields, reused by later runs on the same bulkfiles.
+# Least recently used entries are removed once the cache grows past cache_size_gb. The cache is off (0) unless
+# a size is given, e.g. 50.
+config["cache"] = {
+    "cache_dir" : "field_cache/",
+    "cache_size_gb" : 0
 }
 
 with open(".TurbulenceBoxVisualizer.ini", "w") as file:
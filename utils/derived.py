@@ -0,0 +1,152 @@
+import numpy as np
+import scipy as sp
+from utils.resources import fft_workers
+from utils.shared_blocks import allocate_block, attach_block, block_address
+
+MU_0 = 4 * np.pi * 10**(-7)
+M_P = 1.67262192595 * 10**(-27)
+
+# Fields derived from the fetched variables, computed once per run into shared memory and
+# consumed by the animations by name like a fetched variable, e.g. memory_space["derived/Azpass"].
+# Every entry lists the fetched or derived variable-component pairs it is computed from.
+DERIVED_INPUTS = {
+    ("derived/B_perp", "pass"): [("vg_b_vol", "x"), ("vg_b_vol", "y")],
+    ("derived/Az", "pass"): [("vg_b_vol", "x"), ("vg_b_vol", "y")],
+}
+for component in ["x", "y", "z"]:
+    DERIVED_INPUTS[("derived/b", component)] = [("vg_b_vol", component), ("proton/vg_rho", "pass")]
+    DERIVED_INPUTS[("derived/z_plus", component)] = [("proton/vg_v", component), ("derived/b", component)]
+    DERIVED_INPUTS[("derived/z_minus", component)] = [("proton/vg_v", component), ("derived/b", component)]
+
+# Perpendicular power spectrum |F_x|**2 + |F_y|**2 of every vector variable, stored on the half
+# plane of the real-input transform with shape (frames, x_length, x_length // 2 + 1)
+VECTOR_VARIABLES = ["vg_b_vol", "proton/vg_v", "vg_j", "vg_e_vol"]
+for variable in VECTOR_VARIABLES:
+    DERIVED_INPUTS[("derived/PSD_perp/" + variable, "pass")] = [(variable, "x"), (variable, "y")]
+
+# Order of computation, every derived field comes after the derived fields it needs
+DERIVED_ORDER = ["derived/B_perp", "derived/Az", "derived/b", "derived/z_plus", "derived/z_minus"]
+DERIVED_ORDER += ["derived/PSD_perp/" + variable for variable in VECTOR_VARIABLES]
+
+# Derived fields a set of derived fields depends on, including themselves
+def derived_closure(derived):
+    closure = set(derived)
+    for variable_component in derived:
+        closure |= derived_closure([input for input in DERIVED_INPUTS[variable_component] if input[0].startswith("derived/")])
+    return closure
+
+# Upper bound on the complex temporaries of one batch of frames in the Fourier solvers
+FFT_BATCH_BYTES = 256 * 1024**2
+
+# Inverse of the curl on the real-to-complex Fourier grid, A_z_hat = op_x * B_x_hat + op_y * B_y_hat
+# with op_x = -i k_y / k^2 and op_y = i k_x / k^2, and the undetermined k = 0 mode set to zero.
+# The derivative along an axis has no real Nyquist mode, so for even grids that row/column is zero.
+def curl_inverse(x_length, dx, dtype):
+    kx = 2*np.pi*np.fft.rfftfreq(x_length, d=dx)
+    ky = 2*np.pi*np.fft.fftfreq(x_length, d=dx)
+    KX, KY = np.meshgrid(kx, ky)
+    K2 = KX**2 + KY**2
+    K2[0, 0] = 1
+
+    complex_dtype = np.result_type(dtype, np.complex64)
+    op_x = (-1j * KY / K2).astype(complex_dtype)
+    op_y = (1j * KX / K2).astype(complex_dtype)
+    op_x[0, 0] = 0
+    op_y[0, 0] = 0
+    if x_length % 2 == 0:
+        op_x[x_length // 2, :] = 0
+        op_y[:, -1] = 0
+    return op_x, op_y
+
+# Vector potential A_z of the in-plane magnetic field from B = curl(A_z e_z), solved in Fourier
+# space with real-input transforms, a batch of frames at a time
+def vector_potential(B_x_mesh, B_y_mesh, Az, dx):
+    frames, x_length, _ = B_x_mesh.shape
+    Az = Az.reshape((frames, x_length, x_length))
+
+    op_x, op_y = curl_inverse(x_length, dx, B_x_mesh.dtype)
+    batch = max(1, FFT_BATCH_BYTES // (2 * op_x.nbytes))
+
+    for first in range(0, frames, batch):
+        frames_slice = slice(first, first + batch)
+        Az_hat = sp.fft.rfft2(B_x_mesh[frames_slice], axes=(-2, -1), workers=fft_workers())
+        Az_hat *= op_x
+        By_hat = sp.fft.rfft2(B_y_mesh[frames_slice], axes=(-2, -1), workers=fft_workers())
+        By_hat *= op_y
+        Az_hat += By_hat
+        del By_hat
+        Az[frames_slice] = sp.fft.irfft2(Az_hat, s=(x_length, x_length), axes=(-2, -1), workers=fft_workers())
+
+# Perpendicular power spectrum on the rfft2 half plane, a batch of frames at a time
+def perp_power_spectrum(data_x_mesh, data_y_mesh, PSD_2D_perp):
+    frames, x_length, _ = data_x_mesh.shape
+    batch = max(1, FFT_BATCH_BYTES // (4 * PSD_2D_perp[0].nbytes))
+
+    for first in range(0, frames, batch):
+        frames_slice = slice(first, first + batch)
+        data_ft = sp.fft.rfft2(data_x_mesh[frames_slice], axes=(-2, -1), workers=fft_workers())
+        PSD_2D_perp[frames_slice] = data_ft.real**2 + data_ft.imag**2
+        data_ft = sp.fft.rfft2(data_y_mesh[frames_slice], axes=(-2, -1), workers=fft_workers())
+        PSD_2D_perp[frames_slice] += data_ft.real**2 + data_ft.imag**2
+
+# Shape of a derived field block, the same as its first input unless stored differently
+def derived_shape(name, input_shape, geometry):
+    if name.startswith("derived/PSD_perp/"):
+        return (input_shape[0], geometry["x_length"], geometry["x_length"] // 2 + 1)
+    return input_shape
+
+def derive_one(name, component, inputs, out, geometry):
+    frames = out.shape[0]
+    x_length = geometry["x_length"]
+
+    if name == "derived/B_perp":
+        for frame in range(frames):
+            np.sqrt(inputs[0][frame]**2 + inputs[1][frame]**2, out=out[frame])
+
+    elif name == "derived/Az":
+        vector_potential(
+            inputs[0].reshape((frames, x_length, x_length)), inputs[1].reshape((frames, x_length, x_length)),
+            out, geometry["dx"])
+
+    elif name == "derived/b":
+        # Magnetic field in Alfven units, b = B / sqrt(mu_0 rho)
+        for frame in range(frames):
+            np.divide(inputs[0][frame], np.sqrt(MU_0 * M_P * inputs[1][frame]), out=out[frame])
+
+    elif name == "derived/z_plus":
+        np.add(inputs[0], inputs[1], out=out)
+
+    elif name == "derived/z_minus":
+        np.subtract(inputs[0], inputs[1], out=out)
+
+    elif name.startswith("derived/PSD_perp/"):
+        perp_power_spectrum(
+            inputs[0].reshape((frames, x_length, x_length)), inputs[1].reshape((frames, x_length, x_length)), out)
+
+# Compute the derived fields, given in dependency order, into new shared memory blocks which are
+# added to shared_blocks_dict next to the fetched variables. finished is called with every derived
+# field once it is computed, so that the caller can free inputs nothing else reads.
+def derive(derived, shared_blocks_dict, geometry, finished=None):
+    for name, component in derived:
+        input_blocks = [shared_blocks_dict[input[0] + input[1]] for input in DERIVED_INPUTS[(name, component)]]
+        block = allocate_block(derived_shape(name, input_blocks[0]["shape"], geometry), input_blocks[0]["dtype"])
+
+        handles = []
+        inputs = []
+        for input_block in input_blocks:
+            shm, data = attach_block(block_address(input_block))
+            handles.append(shm)
+            inputs.append(data)
+        shm_out, out = attach_block(block_address(block))
+
+        derive_one(name, component, inputs, out, geometry)
+
+        del inputs, out
+        for shm in handles + [shm_out]:
+            shm.close()
+        shared_blocks_dict[name + component] = block
+
+        if finished is not None:
+            finished(("derived", (name, component)))
+
+    return shared_blocks_dict
@@ -0,0 +1,61 @@
+import os
+import hashlib
+import numpy as np
+
+# Bump when the layout or processing of cached arrays changes
+CACHE_VERSION = 1
+
+# On-disk cache of the per-frame arrays produced by the fetcher. Entries are .npy files keyed by
+# the identity of the bulkfile (path, size, mtime), the variable-component pair and the dtype, and are
+# memory mapped on load. Least recently used entries are evicted when the size cap is exceeded.
+class FieldCache():
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def identity(self, bulkfile, frame):
+        stat = os.stat(bulkfile)
+        return f"{CACHE_VERSION}|{os.path.abspath(bulkfile)}|{frame}|{stat.st_size}|{stat.st_mtime_ns}"
+
+    def key(self, identity, variable, component, dtype):
+        return hashlib.sha1(f"{identity}|{variable}|{component}|{np.dtype(dtype).str}".encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".npy")
+
+    def load(self, key):
+        path = self.path(key)
+        try:
+            data = np.load(path, mmap_mode="r")
+        except (FileNotFoundError, ValueError):
+            return None
+
+        # Touch the entry so that eviction sees it as recently used
+        os.utime(path)
+        return data
+
+    def store(self, key, data):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file first so that readers never see a partial entry
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as file:
+            np.save(file, np.asarray(data))
+        os.replace(tmp, path)
+
+    def evict(self):
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for file in files:
+                if file.endswith(".npy"):
+                    stat = os.stat(os.path.join(root, file))
+                    entries.append((stat.st_mtime, stat.st_size, os.path.join(root, file)))
+
+        total = sum(entry[1] for entry in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
@@ -0,0 +1,48 @@
+import numpy as np
+from utils.shared_blocks import allocate_block, block_address, attach_block, release_block
+
+# Proton inertial length d_p at the reference density of 1e6 m^-3
+prot_plas_freq = np.sqrt(1e6 * (1.602176634 * 10**(-19))**2 / (8.8541878128 * 10**(-12) * 1.67262192595 * 10**(-27)))
+DP = 299792458 / prot_plas_freq
+
+# Block mean of an (N, N, ...) mesh over factor x factor cells, cells beyond the last full block
+# are dropped
+def coarsen(mesh, factor):
+    n = mesh.shape[0] // factor
+    blocks = mesh[:n * factor, :n * factor].reshape((n, factor, n, factor) + mesh.shape[2:])
+    return blocks.mean(axis=(1, 3))
+
+# Read the mesh geometry once from a bulkfile and publish the coordinate meshes (in metres)
+# as shared memory blocks, together with x_length, dx and d_p. With a coarsening factor the
+# geometry is that of the grid of factor x factor cell blocks.
+def publish_geometry(vlsvobj, factor=1):
+    cellids = vlsvobj.read_variable("CellID")
+    x_length = int(vlsvobj.read_parameter("xcells_ini"))
+    coords = np.array(vlsvobj.get_cell_coordinates(np.sort(cellids))).T
+    dx = np.diff(coords[0][0:x_length])[0]
+
+    geometry = {"x_length": x_length // factor, "dx": dx * factor, "dp": DP}
+    for name, values in [("x_mesh", coords[0]), ("y_mesh", coords[1])]:
+        block = allocate_block((x_length // factor, x_length // factor))
+        shm, mesh = attach_block(block_address(block))
+        mesh[:] = coarsen(values.reshape(-1, x_length), factor)
+        del mesh
+        shm.close()
+        geometry[name] = block
+    return geometry
+
+def release_geometry(geometry):
+    release_block(geometry["x_mesh"])
+    release_block(geometry["y_mesh"])
+
+# Read-only view of the published geometry inside an animation process
+class Geometry():
+    def __init__(self, geometry):
+        self.x_length = geometry["x_length"]
+        self.dx = geometry["dx"]
+        self.dp = geometry["dp"]
+
+        self.shm_x, self.x_mesh = attach_block(geometry["x_mesh"])
+        self.shm_y, self.y_mesh = attach_block(geometry["y_mesh"])
+        self.x_mesh.flags.writeable = False
+        self.y_mesh.flags.writeable = False
@@ -0,0 +1,122 @@
+import numpy as np
+from configparser import ConfigParser
+from matplotlib.colors import Normalize
+
+config = ConfigParser()
+config.read(".TurbulenceBoxVisualizer.ini")
+
+# Level of detail: fields with more cells than the axes have pixels are reduced in blocks before
+# drawing, by their mean or by the value of largest magnitude ("maxabs", keeps thin current sheets)
+lod = config.getboolean("settings", "lod", fallback=True)
+lod_reduction = config.get("settings", "lod_reduction", fallback="mean")
+
+# Reduce (ny, nx) data by factor in both directions, cells beyond the last full block are dropped
+def block_reduce(data, factor, reduction="mean"):
+    ny, nx = np.shape(data)
+    blocks = np.asarray(data)[:ny - ny % factor, :nx - nx % factor].reshape(ny // factor, factor, nx // factor, factor)
+    if reduction == "maxabs":
+        largest = blocks.max(axis=(1, 3))
+        smallest = blocks.min(axis=(1, 3))
+        return np.where(-smallest > largest, smallest, largest)
+    return blocks.mean(axis=(1, 3))
+
+# Image artist for a field on a uniform grid, created once and updated in place every frame
+# instead of removing and rebuilding a pcolormesh. x and y are the cell centre coordinates,
+# either 1D or the 2D meshes used with pcolormesh; the cells are drawn edge to edge like
+# pcolormesh draws them, keeping the axes aspect of the pcolormesh plots.
+class Heatmap():
+    def __init__(self, ax, x, y, data, **kwargs):
+        x = np.asarray(x)
+        y = np.asarray(y)
+        if x.ndim == 2:
+            x = x[0]
+        if y.ndim == 2:
+            y = y[:, 0]
+        self.x = x
+        self.y = y
+
+        # The level of detail is decided when the first frame is set, once the colour bar, axis
+        # limits and aspect of the figure are in place
+        self.factor = None
+
+        self.data = data
+        self.image = ax.imshow(
+            self.data, origin="lower", extent=self.extent(1), aspect="auto", interpolation="nearest", **kwargs)
+
+    # Edges of the cells drawn with a reduction by factor, cells dropped by it are left out
+    def extent(self, factor):
+        dx = (self.x[-1] - self.x[0]) / (len(self.x) - 1)
+        dy = (self.y[-1] - self.y[0]) / (len(self.y) - 1)
+        x_cells = len(self.x) - len(self.x) % factor
+        y_cells = len(self.y) - len(self.y) % factor
+        return (self.x[0] - dx/2, self.x[0] - dx/2 + x_cells * dx, self.y[0] - dy/2, self.y[0] - dy/2 + y_cells * dy)
+
+    # Largest reduction that still leaves at least one of the cells inside the axis limits per
+    # pixel of the axes, so zoomed in maps are not reduced
+    def level_of_detail(self):
+        ax = self.image.axes
+        ax.apply_aspect()
+        bbox = ax.get_window_extent()
+        x_min, x_max = sorted(ax.get_xlim())
+        y_min, y_max = sorted(ax.get_ylim())
+        x_cells = np.count_nonzero((self.x >= x_min) & (self.x <= x_max))
+        y_cells = np.count_nonzero((self.y >= y_min) & (self.y <= y_max))
+        return max(1, int(min(x_cells / bbox.width, y_cells / bbox.height)))
+
+    def reduce(self, data):
+        if self.factor == 1:
+            return data
+        return block_reduce(data, self.factor, lod_reduction)
+
+    def set_data(self, data):
+        if self.factor is None:
+            self.factor = self.level_of_detail() if lod else 1
+            self.image.set_extent(self.extent(self.factor))
+        self.data = self.reduce(data)
+        self.image.set_data(self.data)
+        return self.image
+
+    # The colours of the colormap as a uint8 RGB lookup table
+    def lookup_table(self):
+        cmap = self.image.cmap
+        return cmap(np.arange(cmap.N), bytes=True)[:, :3]
+
+    # Lookup table indices of data, the same mapping the image uses: values below and above the
+    # colour limits get the first and last colour
+    def colour_index(self, data):
+        N = self.image.cmap.N
+        norm = self.image.norm
+        if type(norm) is Normalize:
+            scaled = (data - norm.vmin) * (N / (norm.vmax - norm.vmin))
+        else:
+            scaled = np.ma.filled(norm(data), 0) * N
+        np.clip(scaled, 0, N - 1, out=scaled)
+        return scaled.astype(np.intp)
+
+    # Canvas pixels showing the image on a drawn figure of the given height in pixels: the row and
+    # column slices of the canvas array and the data row and column seen at each of them
+    def pixel_map(self, height):
+        ax = self.image.axes
+        bbox = ax.get_window_extent()
+        left, right, bottom, top = self.image.get_extent()
+        inverse = ax.transData.inverted()
+        ny, nx = np.shape(self.data)
+
+        # Pixel centres inside the axes, in display coordinates (y upwards) and as data cells
+        columns = np.arange(int(np.floor(bbox.x0)), int(np.ceil(bbox.x1)))
+        columns = columns[(columns + 0.5 >= bbox.x0) & (columns + 0.5 <= bbox.x1)]
+        x = inverse.transform(np.column_stack([columns + 0.5, np.full(len(columns), bbox.y0)]))[:, 0]
+        data_columns = np.floor((x - left) / (right - left) * nx).astype(np.intp)
+
+        rows = np.arange(int(np.floor(height - bbox.y1)), int(np.ceil(height - bbox.y0)))
+        rows = rows[(height - rows - 0.5 >= bbox.y0) & (height - rows - 0.5 <= bbox.y1)]
+        y = inverse.transform(np.column_stack([np.full(len(rows), bbox.x0), height - rows - 0.5]))[:, 1]
+        data_rows = np.floor((y - bottom) / (top - bottom) * ny).astype(np.intp)
+
+        # Only the part of the axes the image covers
+        shown_columns = (data_columns >= 0) & (data_columns < nx)
+        shown_rows = (data_rows >= 0) & (data_rows < ny)
+        columns, data_columns = columns[shown_columns], data_columns[shown_columns]
+        rows, data_rows = rows[shown_rows], data_rows[shown_rows]
+
+        return slice(rows[0], rows[-1] + 1), slice(columns[0], columns[-1] + 1), data_rows, data_columns
@@ -0,0 +1,73 @@
+import os
+import glob
+import json
+import hashlib
+
+# Bump when the contents of a fingerprint change
+MANIFEST_VERSION = 1
+
+# Settings that do not change what an animation looks like
+NEUTRAL_SETTINGS = ["animations", "cores", "render_segments", "skip_unchanged"]
+
+# Hash of the visualizer's python sources, main.py and utils/, standing for the code version
+def code_hash():
+    utils_dir = os.path.dirname(os.path.abspath(__file__))
+    paths = [os.path.join(os.path.dirname(utils_dir), "main.py")] + sorted(glob.glob(os.path.join(utils_dir, "*.py")))
+
+    digest = hashlib.sha1()
+    for path in paths:
+        if os.path.exists(path):
+            digest.update(os.path.basename(path).encode())
+            with open(path, "rb") as file:
+                digest.update(file.read())
+    return digest.hexdigest()
+
+# Hash of the identity (path, size, mtime) of the bulkfiles of a frame range
+def bulk_identity(bulkpath, frame_numbers):
+    digest = hashlib.sha1()
+    for frame in frame_numbers:
+        bulkfile = bulkpath + f"bulk.{str(frame).zfill(7)}.vlsv"
+        stat = os.stat(bulkfile)
+        digest.update(f"{os.path.abspath(bulkfile)}|{stat.st_size}|{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+# Hash of the config sections an animation depends on, without the per-animation list and the
+# settings that only decide how the work is spread
+def settings_identity(config):
+    settings = {key: value for key, value in config["settings"].items() if key not in NEUTRAL_SETTINGS}
+    paths = {"ffmpeg_path": config["paths"]["ffmpeg_path"]}
+    return hashlib.sha1(json.dumps([settings, paths], sort_keys=True).encode()).hexdigest()
+
+# Fingerprints of finished animations, stored as <output_dir>.manifest.json next to the output
+# directory and keyed by the animation's config entry, since output names need not be unique. An
+# animation whose fingerprint (bulkfiles, frame range, its own specification, settings and code
+# version) is unchanged and whose output still exists is not run again.
+class Manifest():
+    def __init__(self, output_dir):
+        self.path = os.path.normpath(output_dir) + ".manifest.json"
+        try:
+            with open(self.path) as file:
+                self.entries = json.load(file)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    def fingerprint(self, object, bulk, frame_range, settings, code):
+        identity = [MANIFEST_VERSION, bulk, list(frame_range), repr(object.spec), settings, code]
+        return hashlib.sha1(json.dumps(identity).encode()).hexdigest()
+
+    def key(self, object):
+        return repr(object.spec)
+
+    def unchanged(self, object, fingerprint, output):
+        return self.entries.get(self.key(object)) == fingerprint and os.path.exists(output)
+
+    def record(self, object, fingerprint):
+        self.entries[self.key(object)] = fingerprint
+
+    def save(self):
+        # Written to a temporary file first so that an interrupted save keeps the old manifest
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as file:
+            json.dump(self.entries, file, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
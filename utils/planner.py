@@ -0,0 +1,54 @@
+from utils.derived import DERIVED_INPUTS, DERIVED_ORDER, derived_closure
+
+def is_derived(variable_component):
+    return variable_component[0].startswith("derived/")
+
+# Resolves the inputs declared by the animation classes into one plan for the whole run.
+# Every animation class has an inputs(object) staticmethod listing the fetched and derived
+# variable-component pairs it reads; the plan fetches each raw pair once, computes each derived
+# field once in dependency order, and knows the consumers of every shared memory block so that
+# a block can be freed as soon as the last animation or derived field reading it has finished.
+class Plan():
+    def __init__(self, animations, animation_classes):
+        self.inputs = []
+        for object in animations:
+            inputs = set(animation_classes[object.animation_type].inputs(object))
+            inputs.add(("time", "pass"))
+            self.inputs.append(inputs)
+
+        needed = set().union(*self.inputs)
+        self.derived = sorted(derived_closure({pair for pair in needed if is_derived(pair)}),
+                              key=lambda pair: (DERIVED_ORDER.index(pair[0]), pair[1]))
+
+        self.raw = {pair for pair in needed if not is_derived(pair)}
+        for pair in self.derived:
+            self.raw |= {input for input in DERIVED_INPUTS[pair] if not is_derived(input)}
+
+        # Consumers are ("animation", index) or ("derived", variable-component pair)
+        self.consumers = {}
+        for index, inputs in enumerate(self.inputs):
+            for pair in inputs:
+                self.consumers.setdefault(pair[0] + pair[1], set()).add(("animation", index))
+        for pair in self.derived:
+            for input in DERIVED_INPUTS[pair]:
+                self.consumers.setdefault(input[0] + input[1], set()).add(("derived", pair))
+
+    # Fresh consumer bookkeeping for one pass over a frame range
+    def consumers_left(self):
+        return {key: set(consumers) for key, consumers in self.consumers.items()}
+
+    # Keys of the blocks whose last consumer was the one that just finished
+    def finished(self, consumer, consumers_left):
+        free = []
+        for key, consumers in consumers_left.items():
+            if consumer in consumers:
+                consumers.discard(consumer)
+                if not consumers:
+                    free.append(key)
+        return free
+
+    def describe(self):
+        lines = ["fetch: " + ", ".join(sorted(pair[0] + pair[1] for pair in self.raw))]
+        if self.derived:
+            lines.append("derive: " + ", ".join(pair[0] + pair[1] for pair in self.derived))
+        return "\n".join(lines)
@@ -1,9 +1,9 @@
 import os
 from configparser import ConfigParser
-import analysator as pt
 import numpy as np
 import matplotlib.pyplot as plt
 from multiprocessing import shared_memory
+from utils.geometry import Geometry
 
 config = ConfigParser()
 config.read(".TurbulenceBoxVisualizer.ini")
@@ -16,51 +16,53 @@ os.environ['PATH']= config["paths"]["latex_path"] + os.environ['PATH']
 os.environ['PTNOLATEX']='1'
 
 class PlotFranci():
+    @staticmethod
+    def inputs(object):
+        return ([("derived/b", component) for component in ["x","y","z"]]
+                + [("proton/vg_v", component) for component in ["x","y","z"]]
+                + [("vg_b_vol", "z"), ("derived/Az", "pass"), ("vg_j", "z"), ("vg_ttensor", "pass")])
+
     def __init__(self, object):
         memory_space = object.memory_space
 
-        vlsvobj = pt.vlsvfile.VlsvReader(object.bulkpath + "bulk.0000000.vlsv")
-        cellids = vlsvobj.read_variable("CellID")
-
-        x_length = int(vlsvobj.read_parameter("xcells_ini"))
-        x = np.array(vlsvobj.get_cell_coordinates(np.sort(cellids))).T[0]
-        dx = np.diff(x[0:x_length])[0]
+        geometry = Geometry(object.geometry)
+        x_length = geometry.x_length
+        dx = geometry.dx
 
-        mu_0 = 4 * np.pi * 10**(-7)
-        m_p = 1.67262192595 * 10**(-27)
         T_0 = 500 * 10**3
 
         shm_time = shared_memory.SharedMemory(name=memory_space["timepass"]["address"])
         time = np.ndarray(memory_space["timepass"]["shape"], dtype=memory_space["timepass"]["dtype"], buffer=shm_time.buf)
         frames = len(time)
 
-        mem_rho= memory_space["proton/vg_rho" + "pass"]
-        mem_Bx = memory_space["vg_b_vol" + "x"]
-        mem_By = memory_space["vg_b_vol" + "y"]
+        mem_bx = memory_space["derived/b" + "x"]
+        mem_by = memory_space["derived/b" + "y"]
+        mem_bz = memory_space["derived/b" + "z"]
         mem_Bz = memory_space["vg_b_vol" + "z"]
+        mem_Az = memory_space["derived/Az" + "pass"]
         mem_vx = memory_space["proton/vg_v" + "x"]
         mem_vy = memory_space["proton/vg_v" + "y"]
         mem_vz = memory_space["proton/vg_v" + "z"]
         mem_Jz = memory_space["vg_j" + "z"]
         mem_T = memory_space["vg_ttensor" + "pass"]
 
-        shm_rho = shared_memory.SharedMemory(name=mem_rho["address"])
-        shm_Bx = shared_memory.SharedMemory(name=mem_Bx["address"])
-        shm_By = shared_memory.SharedMemory(name=mem_By["address"])
+        shm_bx = shared_memory.SharedMemory(name=mem_bx["address"])
+        shm_by = shared_memory.SharedMemory(name=mem_by["address"])
+        shm_bz = shared_memory.SharedMemory(name=mem_bz["address"])
         shm_Bz = shared_memory.SharedMemory(name=mem_Bz["address"])
+        shm_Az = shared_memory.SharedMemory(name=mem_Az["address"])
         shm_vx = shared_memory.SharedMemory(name=mem_vx["address"])
         shm_vy = shared_memory.SharedMemory(name=mem_vy["address"])
         shm_vz = shared_memory.SharedMemory(name=mem_vz["address"])
         shm_Jz = shared_memory.SharedMemory(name=mem_Jz["address"])
         shm_T = shared_memory.SharedMemory(name=mem_T["address"])
 
-        rho = np.ndarray(mem_rho["shape"], dtype = mem_rho["dtype"], buffer = shm_rho.buf) * m_p
-        Bx = np.ndarray(mem_Bx["shape"], dtype = mem_Bx["dtype"], buffer = shm_Bx.buf)
-        By = np.ndarray(mem_By["shape"], dtype = mem_By["dtype"], buffer = shm_By.buf)
+        # Alfven unit b and A_z come from the shared derived field engine
+        bx = np.ndarray(mem_bx["shape"], dtype = mem_bx["dtype"], buffer = shm_bx.buf)
+        by = np.ndarray(mem_by["shape"], dtype = mem_by["dtype"], buffer = shm_by.buf)
+        bz = np.ndarray(mem_bz["shape"], dtype = mem_bz["dtype"], buffer = shm_bz.buf)
         Bz = np.ndarray(mem_Bz["shape"], dtype = mem_Bz["dtype"], buffer = shm_Bz.buf)
-        bx = Bx / np.sqrt(mu_0 * rho)
-        by = By / np.sqrt(mu_0 * rho)
-        bz = Bz / np.sqrt(mu_0 * rho)
+        Az = np.ndarray(mem_Az["shape"], dtype = mem_Az["dtype"], buffer = shm_Az.buf)
         vx = np.ndarray(mem_vx["shape"], dtype = mem_vx["dtype"], buffer = shm_vx.buf)
         vy = np.ndarray(mem_vy["shape"], dtype = mem_vy["dtype"], buffer = shm_vy.buf)
         vz = np.ndarray(mem_vz["shape"], dtype = mem_vz["dtype"], buffer = shm_vz.buf)
@@ -93,27 +95,7 @@ class PlotFranci():
         sigma_r = np.mean(((vx**2+vy**2+vz**2 - bx**2-by**2-bz**2) / (vx**2+vy**2+vz**2 + bx**2+by**2+bz**2)), axis = 1)
         del bx, by, bz
 
-        kx = 2*np.pi*np.fft.fftfreq(x_length, d=dx)
-        ky = 2*np.pi*np.fft.fftfreq(x_length, d=dx)
-        KX, KY = np.meshgrid(kx, ky)
-        K2 = KX**2 + KY**2
-
-        Bx_mesh = Bx.reshape((frames, x_length, x_length))
-        By_mesh = By.reshape((frames, x_length, x_length))
-        Bz_mesh = Bz.reshape((frames, x_length, x_length))
-
-        Bx_hat = np.fft.fft2(Bx_mesh, axes=(-2, -1))
-        By_hat = np.fft.fft2(By_mesh, axes=(-2, -1))
-
-        num = 1j * (KY*Bx_hat - KX*By_hat)
-        Az_hat = np.empty((frames, x_length, x_length), dtype=complex)
-        mask = K2 != 0
-        for frame in range(frames):
-            Az_hat[frame][mask] = -num[frame][mask] / K2[mask]
-            Az_hat[frame][~mask] = 0
-
-        Az = np.fft.ifft2(Az_hat, axes = (-2, -1)).real
-        sigma_m = np.mean(Az * Bz_mesh, axis=(-2,-1))
+        sigma_m = np.mean(Az * Bz, axis=-1)
 
         plt.rcParams['font.size'] = 12
         fig, axes = plt.subplots(2,2, figsize = (10,10))
@@ -161,8 +143,6 @@ class PlotFranci():
         axes[2].legend()
         axes[3].legend()
 
-        object.name = object.name[0:-3] + "jpg"
-
         fig.savefig(object.name)
 
         plt.close()
\ No newline at end of file
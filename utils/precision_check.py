@@ -0,0 +1,54 @@
+import numpy as np
+import scipy as sp
+from scipy.stats import kurtosis
+from utils.spectra import RadialBinner
+
+# 1D perpendicular PSD of one frame, computed in the precision of the input meshes
+def perp_psd(data_x_mesh, data_y_mesh, nbins=512):
+    PSD_2D_perp = np.abs(sp.fft.fft2(data_x_mesh))**2 + np.abs(sp.fft.fft2(data_y_mesh))**2
+
+    k_xy = sp.fft.fftfreq(data_x_mesh.shape[-1])
+    KX, KY = np.meshgrid(k_xy, k_xy)
+    K_perp = np.sqrt(KX**2 + KY**2).ravel()
+
+    # k = 0 is left out, the fields are mean subtracted so it only holds rounding noise
+    nonzero = K_perp > 0
+    binner = RadialBinner.linear(K_perp[nonzero], 0, np.max(K_perp), nbins)
+    return binner.reduce(PSD_2D_perp.ravel()[nonzero][None], statistic="mean")[0][~binner.empty]
+
+# Kurtosis of normalized x and y increments of one frame for each dl
+def kurtosis_curve(data_mesh, delta_ls):
+    kurtoi = []
+    for dl in delta_ls:
+        delta = np.concatenate([
+            (data_mesh - np.roll(data_mesh, dl, axis=-1)).ravel(),
+            (data_mesh - np.roll(data_mesh, dl, axis=-2)).ravel()])
+        delta = (delta - np.mean(delta)) / np.std(delta)
+        kurtoi.append(kurtosis(delta, fisher=False, bias=True) - 3)
+    return np.array(kurtoi)
+
+def max_relative_deviation(reference, value):
+    reference = np.asarray(reference, dtype=np.float64)
+    value = np.asarray(value, dtype=np.float64)
+    scale = np.maximum(np.abs(reference), np.finfo(np.float64).tiny)
+    return np.max(np.abs(value - reference) / scale)
+
+# Compare PSDs and kurtosis curves of float64 meshes against the same meshes stored in float32.
+# meshes maps component names to one frame of float64 data of shape (x_length, x_length).
+def precision_report(meshes, delta_ls):
+    x_length = next(iter(meshes.values())).shape[-1]
+    # Periodic increments vanish only for lags that are multiples of the box
+    delta_ls = [dl for dl in delta_ls if dl % x_length != 0]
+
+    report = {}
+    if "x" in meshes and "y" in meshes:
+        report["psd"] = max_relative_deviation(
+            perp_psd(meshes["x"], meshes["y"]),
+            perp_psd(meshes["x"].astype(np.float32), meshes["y"].astype(np.float32)))
+
+    # Deviation of the Pearson kurtosis, the excess kurtosis sits near zero for Gaussian increments
+    for component, mesh in meshes.items():
+        report[f"kurtosis_{component}"] = max_relative_deviation(
+            kurtosis_curve(mesh, delta_ls) + 3,
+            kurtosis_curve(mesh.astype(np.float32), delta_ls) + 3)
+    return report
@@ -0,0 +1,72 @@
+import os
+import multiprocessing as mp
+from configparser import ConfigParser
+
+# Nothing here imports numpy, so main.py can set the thread variables before numpy loads BLAS
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+config = ConfigParser()
+config.read(".TurbulenceBoxVisualizer.ini")
+
+# Thread count variables of OpenMP, BLAS and numexpr, inherited by everything started later
+THREAD_VARIABLES = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS"]
+
+# Threads the current process may use, set by apply_threads
+threads = 1
+
+# Pools whose plan has already been printed
+logged = set()
+
+# Cores given to the run, the cores setting or every core this process may run on
+def available_cores():
+    cores = int(config["settings"].get("cores", "0")) if config.has_section("settings") else 0
+    if cores > 0:
+        return cores
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count()
+
+# Split the cores among the processes of a pool and the threads inside each of them
+def split_cores(tasks, cores=None):
+    if cores is None:
+        cores = available_cores()
+    processes = max(1, min(cores, tasks))
+    return processes, max(1, cores // processes)
+
+# Thread count variables for the libraries loaded after this call. OpenMP and BLAS read them
+# once when they are loaded, so main.py sets them before importing numpy.
+def set_thread_variables(count):
+    for variable in THREAD_VARIABLES:
+        os.environ[variable] = str(count)
+
+# Limit FFT, BLAS, OpenMP and numexpr threads of this process, also used as pool initializer.
+# BLAS and OpenMP are already loaded here and only threadpoolctl can change their thread count.
+def apply_threads(count):
+    global threads
+    threads = count
+    set_thread_variables(count)
+    if threadpool_limits is not None:
+        threadpool_limits(count)
+    try:
+        import numexpr as ne
+        ne.set_num_threads(count)
+    except ImportError:
+        pass
+
+# Workers for scipy.fft calls
+def fft_workers():
+    return threads
+
+# Pool for independent tasks sharing the core budget, the split is printed once per name
+def process_pool(tasks, name):
+    processes, pool_threads = split_cores(tasks)
+    if name not in logged:
+        logged.add(name)
+        print(f"resources {name}: {processes} processes x {pool_threads} threads")
+        if threadpool_limits is None and pool_threads < available_cores():
+            print(f"resources {name}: threadpoolctl is not installed, BLAS and OpenMP threads are not limited per process")
+    return mp.Pool(processes, initializer=apply_threads, initargs=(pool_threads,))
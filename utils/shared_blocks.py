@@ -0,0 +1,39 @@
+import numpy as np
+from multiprocessing import shared_memory
+from multiprocessing.resource_tracker import unregister
+
+# Allocate an empty shared memory block and describe it the same way as the memory_space entries
+def allocate_block(shape, dtype=np.float64):
+    dtype = np.dtype(dtype)
+    shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+    unregister(shm._name, 'shared_memory')
+    block = {
+        "address": shm.name,
+        "shape": tuple(shape),
+        "dtype": dtype,
+        "shm": shm,
+    }
+    return block
+
+# Block description without the SharedMemory handle, cheap to send to worker processes
+def block_address(block):
+    return {key: value for key, value in block.items() if key != "shm"}
+
+# Attach to an existing block, returns the handle (to be closed) and the array view
+def attach_block(block):
+    shm = shared_memory.SharedMemory(name=block["address"])
+    unregister(shm._name, 'shared_memory')
+    array = np.ndarray(block["shape"], dtype=block["dtype"], buffer=shm.buf)
+    return shm, array
+
+# Close and unlink a block created by allocate_block
+def release_block(block):
+    block["shm"].close()
+    block["shm"].unlink()
+
+# Close and unlink a block allocated by another process, from its description
+def release_address(block):
+    shm = shared_memory.SharedMemory(name=block["address"])
+    unregister(shm._name, 'shared_memory')
+    shm.close()
+    shm.unlink()
@@ -0,0 +1,143 @@
+import numpy as np
+import scipy as sp
+
+# Wavenumber grids of the rfft2 half plane, k_x along the last axis
+def half_plane_k(x_length, dx):
+    kx = 2 * np.pi * sp.fft.rfftfreq(x_length, dx)
+    ky = 2 * np.pi * sp.fft.fftfreq(x_length, dx)
+    return np.meshgrid(kx, ky)
+
+# Number of full plane modes every half plane column stands for: the k_x = 0 column (and the
+# Nyquist column of even grids) appear once, every other column also stands for its mirror image
+def hermitian_weights(x_length):
+    weights = np.full(x_length // 2 + 1, 2.0)
+    weights[0] = 1
+    if x_length % 2 == 0:
+        weights[-1] = 1
+    return weights
+
+# Full (unshifted) plane of a real spectrum stored on the half plane, using P(-k) = P(k)
+def full_plane(half, x_length):
+    columns = x_length // 2 + 1
+    mirror_rows = (-np.arange(x_length)) % x_length
+    mirror_columns = x_length - np.arange(columns, x_length)
+
+    full = np.empty(half.shape[:-1] + (x_length,), dtype=half.dtype)
+    full[..., :columns] = half
+    full[..., columns:] = half[..., mirror_rows, :][..., mirror_columns]
+    return full
+
+
+# Radial binning of spectra on a fixed wavenumber grid. The bin of every mode is found once, after
+# which a whole (frames, ...) cube is reduced with one bincount per batch of frames by offsetting
+# the bin indices of each frame. Modes can carry weights of the same shape as K_perp, such as the
+# Hermitian weights of a half plane, and bins without any modes are flagged in `empty`.
+class RadialBinner():
+    # Elements of the frame-offset index array handled at a time
+    batch_elements = 2**24
+
+    def __init__(self, K_perp, edges, weights=None):
+        K_perp = np.ravel(K_perp)
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.centres = 0.5 * (self.edges[1:] + self.edges[:-1])
+        self.nbins = len(self.edges) - 1
+
+        # Same bins as scipy.stats.binned_statistic, the last bin includes its right edge
+        index = np.digitize(K_perp, self.edges) - 1
+        index[K_perp == self.edges[-1]] = self.nbins - 1
+        valid = (index >= 0) & (index < self.nbins)
+        if np.all(valid):
+            valid = slice(None)
+        self.valid = valid
+        self.index = index[valid]
+
+        if weights is None:
+            self.weights = None
+        else:
+            self.weights = np.ravel(weights)[valid]
+        self.modes = np.bincount(self.index, weights=self.weights, minlength=self.nbins)
+        self.empty = self.modes == 0
+
+    # Evenly spaced bins from k_min to k_max
+    @classmethod
+    def linear(cls, K_perp, k_min, k_max, nbins, weights=None):
+        return cls(K_perp, np.linspace(k_min, k_max, nbins + 1), weights)
+
+    # Logarithmically spaced bins from k_min to k_max, k_min has to be positive
+    @classmethod
+    def log(cls, K_perp, k_min, k_max, nbins, weights=None):
+        return cls(K_perp, np.logspace(np.log10(k_min), np.log10(k_max), nbins + 1), weights)
+
+    # Sum or (mode weighted) mean of every bin for every frame of a (frames, ...) cube whose
+    # trailing axes match K_perp. Empty bins are 0 for "sum" and nan for "mean".
+    def reduce(self, cube, statistic="sum"):
+        frames = cube.shape[0]
+        values = cube.reshape((frames, -1))
+        sums = np.empty((frames, self.nbins))
+
+        batch = max(1, self.batch_elements // max(len(self.index), 1))
+        for first in range(0, frames, batch):
+            batch_values = values[first:first + batch, self.valid]
+            if self.weights is not None:
+                batch_values = batch_values * self.weights
+            batch_frames = batch_values.shape[0]
+            index = self.index + self.nbins * np.arange(batch_frames)[:, None]
+            sums[first:first + batch] = np.bincount(
+                index.ravel(), weights=batch_values.ravel(), minlength=batch_frames * self.nbins
+            ).reshape((batch_frames, self.nbins))
+
+        if statistic == "mean":
+            sums = np.divide(sums, self.modes, out=np.full_like(sums, np.nan), where=~self.empty)
+        return sums
+
+# Local logarithmic slope d log P / d log k of spectra P (frames, nk) at every k, from a least
+# squares line through the points with k <= k' <= ratio * k, for every window ratio at once.
+# The window sums come from cumulative sums of log k, log P and their products. Returns the slopes
+# and their standard errors, both (frames, len(ratios), nk); windows of fewer than two points
+# have slope 0 and windows of two points have no error estimate (nan).
+def local_slopes(k, P, ratios):
+    k = np.asarray(k, dtype=np.float64)
+    P = np.atleast_2d(np.asarray(P, dtype=np.float64))
+    frames, nk = P.shape
+
+    # Log k centred on its mean, which keeps the sums well conditioned
+    x = np.log10(k)
+    x = x - np.mean(x)
+    y = np.log10(P)
+
+    def cumulative(values):
+        return np.concatenate([np.zeros(values.shape[:-1] + (1,)), np.cumsum(values, axis=-1)], axis=-1)
+
+    C_x = cumulative(x)
+    C_xx = cumulative(x * x)
+    C_y = cumulative(y)
+    C_xy = cumulative(x * y)
+    C_yy = cumulative(y * y)
+
+    slopes = np.zeros((frames, len(ratios), nk))
+    errors = np.full((frames, len(ratios), nk), np.nan)
+    start = np.arange(nk)
+    for j, ratio in enumerate(ratios):
+        end = np.searchsorted(k, k * ratio, side="right")
+        n = end - start
+
+        S_x = C_x[end] - C_x[start]
+        S_xx = C_xx[end] - C_xx[start]
+        S_y = C_y[:, end] - C_y[:, start]
+        S_xy = C_xy[:, end] - C_xy[:, start]
+        S_yy = C_yy[:, end] - C_yy[:, start]
+
+        fit = n > 1
+        S_xx_centred = S_xx[fit] - S_x[fit]**2 / n[fit]
+        S_xy_centred = S_xy[:, fit] - S_x[fit] * S_y[:, fit] / n[fit]
+        S_yy_centred = S_yy[:, fit] - S_y[:, fit]**2 / n[fit]
+        slope = S_xy_centred / S_xx_centred
+        slopes[:, j, fit] = slope
+
+        # Standard error of the slope from the residual variance, needs three or more points
+        spread = n[fit] > 2
+        residual = np.maximum(S_yy_centred - slope * S_xy_centred, 0)
+        errors[:, j, np.flatnonzero(fit)[spread]] = np.sqrt(
+            residual[:, spread] / (n[fit][spread] - 2) / S_xx_centred[spread])
+
+    return slopes, errors
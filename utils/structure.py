@@ -0,0 +1,100 @@
+import numpy as np
+import scipy as sp
+from concurrent.futures import ThreadPoolExecutor
+from utils import resources
+
+# Increments f(r) - f(r - dl) of one (N, N) frame along x (last axis) and y with periodic
+# boundaries, written into out of shape (2, N, N) through slices of the frame instead of
+# rolled or transposed copies
+def increments(mesh, dl, out):
+    x_length = mesh.shape[-1]
+    dl = dl % x_length
+    np.subtract(mesh[:, dl:], mesh[:, :x_length - dl], out=out[0][:, dl:])
+    np.subtract(mesh[:, :dl], mesh[:, x_length - dl:], out=out[0][:, :dl])
+    np.subtract(mesh[dl:], mesh[:x_length - dl], out=out[1][dl:])
+    np.subtract(mesh[:dl], mesh[x_length - dl:], out=out[1][:dl])
+    return out
+
+# Increments of both axes together, normalized to zero mean and unit standard deviation
+def normalized_increments(mesh, dl, out):
+    increments(mesh, dl, out)
+    mean = np.mean(out)
+    SD = np.std(out)
+    out -= mean
+    out /= SD
+    return out
+
+# Apply function to every frame index with the threads given to this process. The heavy numpy
+# loops release the GIL, and animation pool workers are daemonic so they cannot start processes.
+def map_frames(function, frames):
+    with ThreadPoolExecutor(max(1, resources.threads)) as executor:
+        return list(executor.map(function, range(frames)))
+
+# Probability densities of the normalized increments of every frame and lag on one fixed set of
+# evenly spaced edges shared by all frames and lags, (frames, lags, bins). The bin of every
+# sample follows from its value directly, without a search, and is counted with bincount.
+# Samples outside the edges count towards the normalization only.
+def increment_pdfs(data_mesh, delta_ls, edges):
+    frames, x_length, _ = data_mesh.shape
+    bins = len(edges) - 1
+    width = (edges[-1] - edges[0]) / bins
+
+    def frame_pdfs(frame):
+        delta = np.empty((2, x_length, x_length), dtype=np.float64)
+        densities = np.empty((len(delta_ls), bins))
+        for i, dl in enumerate(delta_ls):
+            normalized_increments(data_mesh[frame], dl, delta)
+            delta -= edges[0]
+            delta /= width
+            np.floor(delta, out=delta)
+            # Out of range samples go to an extra bin which is dropped
+            delta[(delta < 0) | (delta > bins)] = bins
+            counts = np.bincount(delta.ravel().astype(np.intp), minlength=bins + 1)
+            densities[i] = counts[:bins] / (delta.size * width)
+        return densities
+
+    return np.array(map_frames(frame_pdfs, frames))
+
+# Excess kurtosis of the increments of every frame and lag, (frames, lags). The moments come from
+# one fused pass over the power sums of each increment array; normalizing the increments does
+# not change the kurtosis, so it is skipped.
+def increment_kurtosis(data_mesh, delta_ls):
+    frames, x_length, _ = data_mesh.shape
+
+    def frame_kurtosis(frame):
+        delta = np.empty((2, x_length, x_length), dtype=np.float64)
+        square = np.empty_like(delta)
+        kurtoi = np.empty(len(delta_ls))
+        for i, dl in enumerate(delta_ls):
+            increments(data_mesh[frame], dl, delta)
+            np.multiply(delta, delta, out=square)
+            E1 = np.mean(delta)
+            E2 = np.mean(square)
+            E3 = np.vdot(square, delta) / delta.size
+            E4 = np.vdot(square, square) / delta.size
+            m2 = E2 - E1**2
+            m4 = E4 - 4*E1*E3 + 6*E1**2*E2 - 3*E1**4
+            kurtoi[i] = m4 / m2**2 - 3
+        return kurtoi
+
+    return np.array(map_frames(frame_kurtosis, frames))
+
+# Autocorrelation C(l) = <f(r) f(r + l)> of the fluctuations of one periodic (N, N) frame for
+# every lag at once from the Wiener-Khinchin relation, C = IFFT(|F|**2) / N**2. The second order
+# structure function follows as S2(l) = <(f(r + l) - f(r))**2> = 2 (C(0) - C(l)).
+def autocorrelation(mesh, workers=1):
+    fluctuation = mesh - np.mean(mesh)
+    fluctuation_ft = sp.fft.rfft2(fluctuation, workers=workers)
+    power = fluctuation_ft.real**2 + fluctuation_ft.imag**2
+    return sp.fft.irfft2(power, s=mesh.shape, workers=workers) / mesh.size
+
+# Correlation length of isotropic autocorrelation curves (frames, lags) sampled at lags 0, 1, 2...
+# cells: the integral of C(l) / C(0) up to its first zero crossing
+def correlation_length(C_iso):
+    R = C_iso / C_iso[:, :1]
+    lengths = np.empty(len(R))
+    for frame, curve in enumerate(R):
+        crossing = np.flatnonzero(curve <= 0)
+        end = crossing[0] + 1 if len(crossing) > 0 else len(curve)
+        lengths[frame] = sp.integrate.trapezoid(np.clip(curve[:end], 0, None))
+    return lengths
@@ -0,0 +1,56 @@
+import numpy as np
+from utils.shared_blocks import allocate_block, block_address, attach_block, release_address
+
+# A summary holds the (minimum, maximum) of every plotted quantity in every frame, (frames, 2) per
+# quantity. Animations rendered in several parts, streaming windows or parallel frame ranges, take
+# their axis and colour limits from the summary of the whole run instead of their own frames.
+#
+# The summarize(object, frames) staticmethod of an animation class returns the summary of the frames
+# and the costly per-frame arrays it computed on the way, such as spectra or kurtosis curves. The
+# summary pass of a parallel render keeps those arrays in shared memory, so that rendering the range
+# reads them back instead of computing them again.
+
+# (minimum, maximum) of each frame of data, NaNs left out
+def frame_limits(data):
+    data = np.asarray(data).reshape(len(data), -1)
+    return np.column_stack([np.nanmin(data, axis=1), np.nanmax(data, axis=1)])
+
+# Summaries of consecutive frame ranges joined in frame order
+def join_summaries(summaries):
+    return {key: np.concatenate([summary[key] for summary in summaries]) for key in summaries[0]}
+
+# (minimum, maximum) of every quantity of a summary over all of its frames
+def run_limits(summary):
+    return {key: (np.nanmin(value[:, 0]), np.nanmax(value[:, 1])) for key, value in summary.items()}
+
+# Copy computed arrays into new shared memory blocks, returns their addresses
+def share_arrays(arrays):
+    blocks = {}
+    for key, array in arrays.items():
+        array = np.asarray(array)
+        block = allocate_block(array.shape, array.dtype)
+        np.ndarray(block["shape"], dtype=block["dtype"], buffer=block["shm"].buf)[...] = array
+        block["shm"].close()
+        blocks[key] = block_address(block)
+    return blocks
+
+# Copies of the arrays in the shared memory blocks of share_arrays
+def read_arrays(blocks):
+    arrays = {}
+    for key, block in blocks.items():
+        shm, array = attach_block(block)
+        arrays[key] = array.copy()
+        del array
+        shm.close()
+    return arrays
+
+def release_arrays(blocks):
+    for block in blocks.values():
+        release_address(block)
+
+# Summary and computed arrays of the frames (a range) an animation renders: read back when the
+# summary pass of a parallel render has computed them, otherwise computed by summarize
+def range_results(animation_class, object, frames):
+    if object.computed:
+        return object.summary, read_arrays(object.computed)
+    return animation_class.summarize(object, slice(frames.start, frames.stop))
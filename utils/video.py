@@ -0,0 +1,253 @@
+import os
+import shutil
+import subprocess
+import numpy as np
+from configparser import ConfigParser
+from matplotlib import animation
+from matplotlib.animation import FFMpegWriter
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+config = ConfigParser()
+config.read(".TurbulenceBoxVisualizer.ini")
+
+ffmpeg_path = config["paths"]["ffmpeg_path"]
+
+# "matplotlib" draws every frame with FuncAnimation, "raw" pipes heat map animations to ffmpeg directly
+renderer = config.get("settings", "renderer", fallback="matplotlib")
+
+# "video" saves one video per animation, "frames" numbered image files that survive an interrupted run
+output_mode = config.get("settings", "output_mode", fallback="video")
+frame_format = config.get("settings", "frame_format", fallback="png")
+encode_frames = config.getboolean("settings", "encode_frames", fallback=True)
+
+# Name of the index:th segment of an output file, e.g. name.part0003.mp4
+def segment_name(name, index):
+    root, extension = os.path.splitext(name)
+    return f"{root}.part{str(index).zfill(4)}{extension}"
+
+# Frame rate of every animation
+FPS = 5
+
+# Output an animation object writes to name: name itself, or in streaming mode the segment of
+# name of the window it is rendered in
+def window_name(object, name):
+    if object.window is None:
+        return name
+    return segment_name(name, object.window)
+
+# Segments of a parallel render are stored losslessly and encoded once after joining them, so the
+# result is the same video a serial render writes
+SEGMENT_CODEC = "ffv1"
+SEGMENT_EXTENSION = ".mkv"
+
+# Join video segments with ffmpeg's concat demuxer and remove the segments. The streams are copied
+# losslessly, or with encode the joined frames are encoded with the arguments of FFMpegWriter.
+def concat_segments(segments, name, encode=False):
+    segments = [segment for segment in segments if os.path.exists(segment)]
+    if len(segments) == 0:
+        return
+
+    list_file = name + ".segments.txt"
+    with open(list_file, "w") as file:
+        for segment in segments:
+            file.write(f"file '{os.path.abspath(segment)}'\n")
+
+    if encode:
+        writer = FFMpegWriter(fps=FPS)
+        writer.outfile = name
+        output_args = ["-r", str(FPS)] + writer.output_args
+    else:
+        output_args = ["-c", "copy", "-y", name]
+
+    subprocess.run(
+        [ffmpeg_path, "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_file] + output_args,
+        check=True)
+
+    os.remove(list_file)
+    for segment in segments:
+        os.remove(segment)
+
+# Arrays of the .npz data files next to the animations that hold one row per frame
+PER_FRAME_ARRAYS = ["time", "kurtosis", "S2_iso", "correlation_length"]
+
+# Join the .npz data files of segments into name in frame order and remove them. The per frame
+# arrays are concatenated, the others are the same in every segment and kept once.
+def concat_npz(segments, name):
+    segments = [segment for segment in segments if os.path.exists(segment)]
+    if len(segments) == 0:
+        return
+
+    parts = []
+    for segment in segments:
+        with np.load(segment) as part:
+            parts.append(dict(part))
+
+    joined = {}
+    for key in parts[0]:
+        if key in PER_FRAME_ARRAYS:
+            joined[key] = np.concatenate([part[key] for part in parts])
+        else:
+            joined[key] = parts[0][key]
+    np.savez(name, **joined)
+
+    for segment in segments:
+        if segment != name:
+            os.remove(segment)
+
+# Store arrays of the frames an animation renders next to its output as name.npz. Rendered in parts,
+# every part writes its own file, recorded in object.rendered, and the parts are joined in frame order.
+def save_data(object, **arrays):
+    data_name = window_name(object, os.path.splitext(object.name)[0] + ".npz")
+    if object.render_range is None:
+        data_file = data_name
+    else:
+        data_file = segment_name(data_name, object.render_segment)
+    np.savez(data_file, **arrays)
+    object.rendered.append((data_file, data_name))
+
+# Directory of the frame files of an output file, e.g. name_frames/<fingerprint>/ for name.mp4. Frame
+# files are only reused by runs with the same manifest fingerprint: the same bulkfiles, frame range,
+# animation, settings and code.
+def frames_dir(name, fingerprint):
+    return os.path.join(os.path.splitext(name)[0] + "_frames", fingerprint[:12])
+
+# Remove the frame files of name written under other fingerprints, before anything is rendered
+def remove_stale_frames(name, fingerprint):
+    root = os.path.dirname(frames_dir(name, fingerprint))
+    if not os.path.isdir(root):
+        return
+    for entry in os.listdir(root):
+        path = os.path.join(root, entry)
+        if path == frames_dir(name, fingerprint):
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+def frame_file(directory, frame):
+    return os.path.join(directory, f"frame_{str(frame).zfill(6)}.{frame_format}")
+
+# Write every frame of frame_sequence that is not on disk yet as a numbered image file, numbered
+# from offset on. Each file is saved under a temporary name and renamed, so a killed job never
+# leaves a partial frame behind.
+def save_frames(fig, update, frame_sequence, directory, dpi=None, offset=0):
+    os.makedirs(directory, exist_ok=True)
+    for frame in frame_sequence:
+        path = frame_file(directory, offset + frame)
+        if os.path.exists(path):
+            continue
+        update(frame)
+        temporary = path + ".tmp"
+        fig.savefig(temporary, format=frame_format, dpi=dpi)
+        os.replace(temporary, path)
+
+# Encode the frame files of directory into name with the output arguments of FFMpegWriter,
+# padding odd frame sizes to even ones for yuv420p
+def encode_frame_files(directory, name):
+    writer = FFMpegWriter(fps=FPS)
+    writer.outfile = name
+    subprocess.run(
+        [ffmpeg_path, "-loglevel", "error", "-framerate", str(FPS), "-i", os.path.join(directory, f"frame_%06d.{frame_format}"),
+         "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2"] + writer.output_args,
+        check=True)
+
+# Contiguous frame ranges (first, last) of a parallel render, at most segments of them
+def frame_ranges(frames, segments):
+    segments = max(1, min(segments, frames))
+    bounds = [frames * i // segments for i in range(segments + 1)]
+    return [(bounds[i], bounds[i + 1]) for i in range(segments)]
+
+# Frames an animation of frames 0...frames-1 draws: all of them, or those of its render range
+def render_frames(object, frames):
+    if object.render_range is None:
+        return range(frames)
+    first, last = object.render_range
+    if last is None:
+        last = frames
+    return range(first, last)
+
+# Render frames 0...frames-1 of an animation with update into name. When the animation object
+# carries a render range, only that range is rendered, into a lossless segment of name; the last
+# range runs to the end. The written file and its final name are recorded in object.rendered.
+# Animations drawn with Heatmaps pass them in heatmaps and can use the raw renderer. In frames
+# output mode the frames go to the frame files of name instead, numbered over the whole run, and
+# are encoded once every window has been rendered.
+def save_animation(fig, update, frames, name, object, dpi=None, heatmaps=None):
+    frame_sequence = render_frames(object, frames)
+
+    if output_mode == "frames":
+        save_frames(fig, update, frame_sequence, frames_dir(name, object.fingerprint), dpi, object.frame_offset)
+        return
+
+    name = window_name(object, name)
+
+    if object.render_range is None:
+        output = name
+        writer = FFMpegWriter(fps=FPS)
+    else:
+        output = os.path.splitext(segment_name(name, object.render_segment))[0] + SEGMENT_EXTENSION
+        writer = FFMpegWriter(fps=FPS, codec=SEGMENT_CODEC)
+
+    if heatmaps is not None and renderer == "raw":
+        writer.outfile = output
+        save_raw(fig, update, frame_sequence, writer, heatmaps, dpi)
+    else:
+        anim = animation.FuncAnimation(fig, update, frames = frame_sequence, interval = 20)
+        anim.save(output, writer = writer, dpi = dpi)
+    object.rendered.append((output, name))
+
+# Render heat map animations without drawing the whole figure every frame. The figure is drawn
+# once without the heat maps and the artists update changes. Every frame the fields are coloured
+# through the lookup tables of their colormaps into a copy of that background, the other changed
+# artists (time labels, contours) and the axes frames are drawn over them with draw_artist, and
+# the rgb24 frame is piped straight to ffmpeg with the output arguments of writer.
+def save_raw(fig, update, frame_sequence, writer, heatmaps, dpi=None):
+    if dpi is not None:
+        fig.set_dpi(dpi)
+    canvas = FigureCanvasAgg(fig)
+
+    images = [heatmap.image for heatmap in heatmaps]
+    changed = [artist for artist in update(frame_sequence[0]) if artist not in images]
+    for artist in images + changed:
+        artist.set_visible(False)
+    canvas.draw()
+    background = canvas.copy_from_bbox(fig.bbox)
+    for artist in changed:
+        artist.set_visible(True)
+
+    pixels = np.asarray(canvas.buffer_rgba())
+    height, width = pixels.shape[:2]
+    pixel_maps = [heatmap.pixel_map(height) for heatmap in heatmaps]
+    lookup_tables = [heatmap.lookup_table() for heatmap in heatmaps]
+    axes = [image.axes for image in images]
+
+    # libx264 with yuv420p needs even frame sizes
+    height -= height % 2
+    width -= width % 2
+    command = [
+        ffmpeg_path, "-f", "rawvideo", "-vcodec", "rawvideo", "-s", f"{width}x{height}",
+        "-pix_fmt", "rgb24", "-framerate", str(FPS), "-loglevel", "error", "-i", "pipe:"
+        ] + writer.output_args
+    process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    frame_rgb = np.empty((height, width, 3), dtype=np.uint8)
+    for frame in frame_sequence:
+        changed = [artist for artist in update(frame) if artist not in images]
+        canvas.restore_region(background)
+        pixels = np.asarray(canvas.buffer_rgba())
+        for heatmap, lookup_table, (rows, columns, data_rows, data_columns) in zip(heatmaps, lookup_tables, pixel_maps):
+            sampled = heatmap.data[data_rows[:, None], data_columns]
+            pixels[rows, columns, :3] = lookup_table[heatmap.colour_index(sampled)]
+        for artist in changed:
+            fig.draw_artist(artist)
+        for ax in axes:
+            for spine in ax.spines.values():
+                ax.draw_artist(spine)
+
+        frame_rgb[...] = pixels[:height, :width, :3]
+        process.stdin.write(frame_rgb.data)
+
+    process.stdin.close()
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)